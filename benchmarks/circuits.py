@@ -0,0 +1,188 @@
+import typing as t
+
+import string
+import random
+
+
+GRID_SIZE = 20
+
+PINS = {
+    "AND": ([(0, 10), (0, 30), (0, 50)], (60, 30)),
+    "OR": ([(0, 10), (0, 30), (0, 50)], (60, 30)),
+    "XOR": ([(0, 10), (0, 30), (0, 50)], (60, 30)),
+    "NOT": ([(0, 10)], (20, 10)),
+    "INPUT": ([], (20, 10)),
+    "OUTPUT": ([(0, 10)], None),
+}
+
+
+class CircuitBuilder:
+    """
+    Builds gates and wires in the shape the editor submits them. Inputs and
+    outputs are placed like `loadGates` places them, every other gate gets its
+    own cell on a grid and wires that need bends go through junction points
+    below the gates.
+    """
+
+    def __init__(self, inputs: int, outputs: int) -> None:
+        self.gates: list[dict] = []
+        self.wires: list[dict] = []
+        self.inputs: list[dict] = []
+        self.outputs: list[dict] = []
+
+        self._cells = 0
+        self._junctions = 0
+
+        for i in range(inputs):
+            self.inputs.append(self._place("INPUT", 520, 120 + 2 * GRID_SIZE * i, string.ascii_uppercase[i]))
+
+        for i in range(outputs):
+            self.outputs.append(self._place("OUTPUT", 1000, 120 + 2 * GRID_SIZE * i, string.ascii_uppercase[25 - i]))
+
+    def _place(self, type: str, x: int, y: int, id: t.Optional[str]=None) -> dict:
+        inputs, output = PINS[type]
+        gate = {
+            "x": x,
+            "y": y,
+            "type": type,
+            "rotation": 0,
+            "inputs": [{"x": x + dx, "y": y + dy} for dx, dy in inputs],
+            "output": {"x": x + output[0], "y": y + output[1]} if output else {"x": None, "y": None},
+            "state": "off",
+            "id": id,
+        }
+        self.gates.append(gate)
+        return gate
+
+    def _junction(self) -> tuple[int, int]:
+        self._junctions += 1
+        return 100 * GRID_SIZE + self._junctions * GRID_SIZE, 500 * GRID_SIZE + self._junctions * GRID_SIZE
+
+    def gate(self, type: str) -> dict:
+        column, row = divmod(self._cells, 50)
+        self._cells += 1
+        return self._place(type, 1200 + 4 * GRID_SIZE * column, 120 + 4 * GRID_SIZE * row)
+
+    def connect(self, source: dict, target: dict, pin: int=0, bends: int=0) -> None:
+        x, y = source["output"]["x"], source["output"]["y"]
+
+        for _ in range(bends):
+            next_x, next_y = self._junction()
+            self.wires.append({"startX": x, "startY": y, "endX": next_x, "endY": next_y, "state": "off"})
+            x, y = next_x, next_y
+
+        end = target["inputs"][pin]
+        self.wires.append({"startX": x, "startY": y, "endX": end["x"], "endY": end["y"], "state": "off"})
+
+    def combine(self, type: str, *sources: dict) -> dict:
+        gate = self.gate(type)
+        for pin, source in enumerate(sources):
+            self.connect(source, gate, pin)
+
+        return gate
+
+    def circuit(self) -> tuple[list[dict], list[dict]]:
+        return self.gates, self.wires
+
+
+def random_dag(inputs: int, outputs: int, size: int, seed: int=0) -> tuple[list[dict], list[dict]]:
+    rng = random.Random(seed)
+    builder = CircuitBuilder(inputs, outputs)
+    drivers = list(builder.inputs)
+
+    for _ in range(size):
+        type = rng.choice(["AND", "OR", "XOR", "NOT"])
+        pins = 1 if type == "NOT" else rng.randint(2, 3)
+        gate = builder.gate(type)
+
+        for pin in range(pins):
+            builder.connect(rng.choice(drivers), gate, pin, bends=rng.choice([0, 0, 0, 1, 2]))
+
+        drivers.append(gate)
+
+    for output in builder.outputs:
+        builder.connect(rng.choice(drivers[-max(1, size // 4):]), output)
+
+    return builder.circuit()
+
+
+def adder(inputs: int, outputs: int, seed: int=0) -> tuple[list[dict], list[dict]]:
+    """Ripple carry adder of the first and second half of the inputs."""
+    builder = CircuitBuilder(inputs, outputs)
+    bits = max(1, inputs // 2)
+    left, right = builder.inputs[:bits], builder.inputs[bits:2 * bits] or builder.inputs[:bits]
+
+    sums, carry = [], None
+    for a, b in zip(reversed(left), reversed(right)):
+        half = builder.combine("XOR", a, b)
+        generate = builder.combine("AND", a, b)
+
+        if not carry:
+            sums.append(half)
+            carry = generate
+            continue
+
+        sums.append(builder.combine("XOR", half, carry))
+        carry = builder.combine("OR", generate, builder.combine("AND", half, carry))
+
+    bits = [carry] + list(reversed(sums))
+    for i, output in enumerate(builder.outputs):
+        builder.connect(bits[i % len(bits)], output)
+
+    return builder.circuit()
+
+
+def multiplexer(inputs: int, outputs: int, seed: int=0) -> tuple[list[dict], list[dict]]:
+    """The first input selects between two of the other inputs for every output."""
+    rng = random.Random(seed)
+    builder = CircuitBuilder(inputs, outputs)
+    select, data = builder.inputs[0], builder.inputs[1:] or builder.inputs
+    inverted = builder.combine("NOT", select)
+
+    for output in builder.outputs:
+        low = builder.combine("AND", inverted, rng.choice(data))
+        high = builder.combine("AND", select, rng.choice(data))
+        builder.connect(builder.combine("OR", low, high), output)
+
+    return builder.circuit()
+
+
+def wire_chain(inputs: int, outputs: int, length: int, seed: int=0) -> tuple[list[dict], list[dict]]:
+    """`length` wire segments in series with a NOT gate every 100 segments."""
+    builder = CircuitBuilder(inputs, outputs)
+    driver = builder.inputs[0]
+
+    for _ in range(max(1, length // 100)):
+        gate = builder.gate("NOT")
+        builder.connect(driver, gate, bends=min(length, 100))
+        driver = gate
+
+    for output in builder.outputs:
+        builder.connect(driver, output)
+
+    return builder.circuit()
+
+
+def fan_out(inputs: int, outputs: int, width: int, seed: int=0) -> tuple[list[dict], list[dict]]:
+    """Every input drives `width` gates that are reduced back into the outputs."""
+    rng = random.Random(seed)
+    builder = CircuitBuilder(inputs, outputs)
+    layer = []
+
+    for _ in range(width):
+        type = rng.choice(["AND", "OR", "XOR"])
+        layer.append(builder.combine(type, *rng.sample(builder.inputs, min(len(builder.inputs), 3))))
+
+    for output in builder.outputs:
+        builder.connect(builder.combine("XOR", *rng.sample(layer, min(len(layer), 3))), output)
+
+    return builder.circuit()
+
+
+GENERATORS: dict[str, t.Callable[..., tuple[list[dict], list[dict]]]] = {
+    "random_dag": random_dag,
+    "adder": adder,
+    "multiplexer": multiplexer,
+    "wire_chain": wire_chain,
+    "fan_out": fan_out,
+}
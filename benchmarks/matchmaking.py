@@ -0,0 +1,104 @@
+"""
+Joins thousands of players to random battles at once and checks how the
+matchmaker seats them.
+
+    python -m benchmarks.matchmaking --players 5000 --threads 64 --lobbies 1000
+
+Opens --lobbies public battles with one player each, spread over a few
+configurations, and lets --threads threads claim seats for --players
+players. Half the players ask for a configuration, the others take any.
+Checks that no lobby got more than --capacity players and that nobody was
+turned away while there were free seats in a matching lobby, then
+compares how full lobbies got with the old lookup, which sent everyone to
+the first queueing battle. Exits with 1 when a check fails.
+"""
+from bit_battles.battles.matchmaking import Matchmaker, get_configuration
+
+from collections import Counter, defaultdict
+
+import typing as t
+import threading
+import argparse
+import random
+import time
+import sys
+
+
+CONFIGURATIONS = [
+    get_configuration(inputs, outputs, ["AND", "NOT", "OR"] + (["XOR"] if xor else []))
+    for inputs, outputs, xor in [(2, 1, False), (2, 2, False), (3, 2, False), (3, 2, True), (4, 3, True)]
+]
+
+
+def _rating(rng: random.Random, rated: float) -> t.Optional[float]:
+    return rng.uniform(0, 300) if rng.random() < rated else None
+
+
+def main(arguments: t.Optional[list[str]]=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the matchmaking queues.")
+    parser.add_argument("--players", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--lobbies", type=int, default=1000)
+    parser.add_argument("--capacity", type=int, default=3)
+    parser.add_argument("--band", type=float, default=50, help="rating band, 0 turns it off")
+    parser.add_argument("--rated", type=float, default=0.7, help="share of players with a rating")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(arguments)
+
+    rng = random.Random(args.seed)
+    matchmaker = Matchmaker(args.capacity, args.band)
+
+    lobbies: dict[str, t.Any] = {}
+    for index in range(args.lobbies):
+        battle_id = f"battle-{index}"
+        lobbies[battle_id] = rng.choice(CONFIGURATIONS)
+        matchmaker.open(battle_id, lobbies[battle_id], {f"owner-{index}": _rating(rng, args.rated)})
+
+    players = [
+        (f"player-{index}", rng.choice(CONFIGURATIONS) if rng.random() < 0.5 else None, _rating(rng, args.rated))
+        for index in range(args.players)
+    ]
+
+    seats: dict[str, list[str]] = defaultdict(list)
+    turned_away: list[tuple] = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.threads)
+
+    def run(batch: list[tuple]) -> None:
+        barrier.wait()
+
+        for user_id, configuration, rating in batch:
+            battle_id = matchmaker.claim(configuration, user_id, rating)
+
+            with lock:
+                if battle_id:
+                    seats[battle_id].append(user_id)
+                else:
+                    turned_away.append(configuration)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=run, args=(players[index::args.threads],)) for index in range(args.threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    duration = time.perf_counter() - start
+
+    sizes = Counter(1 + len(seats[battle_id]) for battle_id in lobbies)
+    overfull = sum(count for size, count in sizes.items() if size > args.capacity)
+
+    # Nobody asking for a configuration may be turned away while a lobby of it has free seats.
+    free = Counter(lobbies[battle_id] for battle_id in lobbies if 1 + len(seats[battle_id]) < args.capacity)
+    unfair = sum(1 for configuration in turned_away if (free[configuration] if configuration else sum(free.values())))
+
+    print(f"{args.players} players on {args.threads} threads, {args.players / duration:,.0f} claims/s")
+    print(f"{sum(len(s) for s in seats.values())} seated, {len(turned_away)} turned away, {matchmaker.stats()['queued']} lobbies still queued")
+    print("Players per lobby: " + ", ".join(f"{size}: {sizes[size]}" for size in sorted(sizes)))
+    print(f"First queueing battle: 1 lobby with {1 + args.players} players, {args.lobbies - 1} with 1")
+    print(f"{overfull} lobbies over capacity, {unfair} players turned away with free seats left")
+
+    return 1 if overfull or unfair else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Checks that an eventlet worker exits once it has run simulations in the
+pool, and that circuits still queued for writing are flushed on the way.
+
+    python -m benchmarks.pool_shutdown [--timeout 30]
+
+Starts a monkey patched process like `gunicorn -k eventlet` does, runs a
+job in the simulation pool, leaves a job running that only the CPU budget
+stops, queues a circuit and lets the process end. Exits with 1 when the
+process doesn't exit in time or the circuit wasn't written.
+"""
+import typing as t
+import subprocess
+import argparse
+import time
+import sys
+import os
+
+
+def _spin() -> None:
+    while True:
+        pass
+
+
+def _run_busy(pool: t.Any) -> None:
+    try:
+        pool.run(_spin)
+    except Exception as e:
+        print(f"Busy job ended: {e}")
+
+
+def _child(circuit_id: int) -> None:
+    import eventlet
+    eventlet.monkey_patch()
+
+    from bit_battles.utils.circuit import circuit_writer
+    from bit_battles.utils.verdicts import simulation_pool
+
+    print(f"Pool returned {simulation_pool.run(len, [1, 2, 3])}.")
+
+    eventlet.spawn(_run_busy, simulation_pool)
+    eventlet.sleep(0.5)
+
+    circuit_writer.put("battle", (circuit_id, "pool-shutdown", "pool-shutdown", "0" * 32, time.time(), b"{}"))
+
+
+def main(arguments: t.Optional[list[str]]=None) -> int:
+    parser = argparse.ArgumentParser(description="Check that an eventlet process exits after using the simulation pool.")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(arguments)
+
+    if args.child:
+        _child(args.child)
+        return 0
+
+    circuit_id = time.time_ns() // 1000
+    env = dict(os.environ, SIMULATION_WORKERS=os.getenv("SIMULATION_WORKERS", "2"))
+    start = time.perf_counter()
+
+    try:
+        subprocess.run([sys.executable, "-m", "benchmarks.pool_shutdown", "--child", str(circuit_id)], env=env, timeout=args.timeout, check=True)
+    except subprocess.TimeoutExpired:
+        print(f"The process didn't exit within {args.timeout:g}s.")
+        return 1
+    except subprocess.CalledProcessError as e:
+        print(f"The process failed with exit code {e.returncode}.")
+        return 1
+
+    print(f"The process exited after {time.perf_counter() - start:.2f}s.")
+
+    from bit_battles.utils.storage import get_db_connection
+
+    with get_db_connection() as conn:
+        written = conn.execute("SELECT 1 FROM battle_circuits WHERE id = ?", (circuit_id,)).fetchone()
+        conn.execute("DELETE FROM battle_circuits WHERE id = ?", (circuit_id,))
+        conn.commit()
+
+    if not written:
+        print("The queued circuit wasn't written.")
+        return 1
+
+    print("The queued circuit was written.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Checks with EXPLAIN QUERY PLAN that the queries on hot paths use an index.
+
+    flask db upgrade
+    python -m benchmarks.query_plans
+
+Runs against the app's database, so it checks the migrations as well as
+the queries, and exits with 1 when any query scans a whole table.
+"""
+from bit_battles.challenges.models import DailyChallengeStatistic, ChallengeStatistic, Challenge, CATALOGUE_SORTS
+from bit_battles.battles.models import Battle, Player, BattleStatistic
+from bit_battles.auth.models import User
+from bit_battles.extensions import db
+from bit_battles import create_app
+
+from datetime import date
+
+import typing as t
+import argparse
+import re
+import sys
+
+
+# "SCAN table" reads every row, "SEARCH table USING INDEX" doesn't.
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)")
+
+
+def _queries() -> dict[str, t.Any]:
+    today = date(2026, 1, 1)
+
+    queries = {
+        "user by token": User.query.filter_by(token="token"),
+        "user by battle token": User.query.filter_by(battle_token="token"),
+        "player by user": Player.query.filter_by(user_id="user"),
+        "public battles in queue": Battle.query.filter_by(stage="queue", private=False),
+        "battle statistics of user": BattleStatistic.query.filter_by(user_id="user").order_by(BattleStatistic.creation_timestamp.desc()),
+        "daily leaderboard": DailyChallengeStatistic.query.filter(DailyChallengeStatistic.date == today, DailyChallengeStatistic.passed == True),
+        "daily statistic of user": DailyChallengeStatistic.query.filter_by(user_id="user", date=today, passed=False),
+        "daily history of user": DailyChallengeStatistic.query.filter_by(user_id="user", passed=True).order_by(DailyChallengeStatistic.date),
+        "challenge leaderboard": ChallengeStatistic.query.filter(ChallengeStatistic.challenge_id == "challenge", ChallengeStatistic.passed == True),
+        "challenge statistic of user": ChallengeStatistic.query.filter_by(user_id="user", challenge_id="challenge", passed=False),
+        "challenges passed by user": ChallengeStatistic.query.filter_by(user_id="user", passed=True),
+        "challenges completed on page": ChallengeStatistic.query.filter(
+            ChallengeStatistic.user_id == "user", ChallengeStatistic.challenge_id.in_(["a", "b"]), ChallengeStatistic.passed == True
+        ),
+        "challenges of user": Challenge.query.filter_by(user_id="user"),
+    }
+
+    for sort, order in CATALOGUE_SORTS.items():
+        queries[f"catalogue by {sort}"] = Challenge.query.filter_by(official=False).order_by(*order, Challenge.id.desc()).limit(25)
+
+    return queries
+
+
+def _plan(query: t.Any) -> list[str]:
+    sql = query.statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+    return [row[3] for row in db.session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+
+
+def main(arguments: t.Optional[list[str]]=None) -> int:
+    parser = argparse.ArgumentParser(description="Check that hot queries use an index.")
+    parser.add_argument("--verbose", action="store_true", help="print the plan of every query")
+    args = parser.parse_args(arguments)
+
+    failed = []
+
+    with create_app().app_context():
+        for name, query in _queries().items():
+            plan = _plan(query)
+            scans = [step for step in plan if FULL_SCAN.match(step)]
+            if scans:
+                failed.append(name)
+
+            if scans or args.verbose:
+                print(f"{'FAIL' if scans else 'ok'}  {name}")
+                for step in plan:
+                    print(f"      {step}")
+
+    if failed:
+        print(f"{len(failed)} queries scan a whole table: {', '.join(failed)}")
+        return 1
+
+    print("Every query uses an index.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
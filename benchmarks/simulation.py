@@ -0,0 +1,181 @@
+"""
+Times `Simulate.test` on generated circuits of increasing size.
+
+    python -m benchmarks.simulation --output baseline.json
+    python -m benchmarks.simulation --baseline baseline.json --output simulation.json
+
+Results are only written with --output. With a baseline the run exits
+with 1 when a case got slower than the tolerance allows, so it can run
+before a deploy.
+"""
+from benchmarks.circuits import GENERATORS
+from bit_battles.utils.battle import Simulate, TableGenerator, ENGINES
+from bit_battles.utils.netlist import Netlist
+
+from datetime import datetime, timezone
+
+import statistics
+import tracemalloc
+import typing as t
+import argparse
+import platform
+import orjson
+import time
+import sys
+import os
+
+
+TABLES = [(1, 1), (2, 4), (3, 8), (4, 12)]
+
+CASES: list[tuple[str, dict]] = [
+    ("random_dag", {"size": 16}),
+    ("random_dag", {"size": 64}),
+    ("random_dag", {"size": 256}),
+    ("random_dag", {"size": 1024}),
+    ("adder", {}),
+    ("multiplexer", {}),
+    ("wire_chain", {"length": 1000}),
+    ("wire_chain", {"length": 10000}),
+    ("fan_out", {"width": 64}),
+    ("fan_out", {"width": 512}),
+]
+
+
+def get_truthtable(gates: list[dict], wires: list[dict], inputs: int, outputs: int) -> dict:
+    """Table with the outputs the circuit computes, so every row gets tested."""
+    netlist = Netlist(gates, wires, {})
+    table = TableGenerator(inputs, 0).table
+    output = {netlist.ids[node]: [] for node in netlist.outputs}
+
+    for row in range(2 ** inputs):
+        values = netlist.evaluate({key: column[row] for key, column in table.items()})
+
+        for node in netlist.outputs:
+            output[netlist.ids[node]].append(values[node])
+
+    return dict(TableGenerator(inputs, outputs, output).table)
+
+
+def _percentile(samples: list[float], percentile: int) -> float:
+    if len(samples) < 2:
+        return samples[0]
+
+    return statistics.quantiles(samples, n=100, method="inclusive")[percentile - 1]
+
+
+def get_label(name: str, options: dict, inputs: int, outputs: int, engine: str) -> str:
+    return "-".join([name] + [f"{key}={value}" for key, value in options.items()] + [f"{inputs}x{outputs}", engine])
+
+
+def run_case(name: str, options: dict, inputs: int, outputs: int, engine: str, repeat: int) -> dict:
+    gates, wires = GENERATORS[name](inputs, outputs, **options)
+    truthtable = get_truthtable(gates, wires, inputs, outputs)
+    rows = 2 ** inputs
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        passed, _ = Simulate(gates, wires, {}, engine).test(truthtable)
+        samples.append(time.perf_counter() - start)
+
+        if not passed:
+            raise RuntimeError(f"{name} {options} failed its own truthtable.")
+
+    tracemalloc.start()
+    Simulate(gates, wires, {}, engine).test(truthtable)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(samples)
+
+    return {
+        "case": get_label(name, options, inputs, outputs, engine),
+        "generator": name,
+        "options": options,
+        "inputs": inputs,
+        "outputs": outputs,
+        "engine": engine,
+        "gates": len(gates),
+        "wires": len(wires),
+        "rows": rows,
+        "repeat": repeat,
+        "p50": median,
+        "p90": _percentile(samples, 90),
+        "p99": _percentile(samples, 99),
+        "min": min(samples),
+        "max": max(samples),
+        "rows_per_second": rows / median,
+        "gates_per_second": len(gates) * rows / median,
+        "peak_memory": peak,
+    }
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    previous = {result["case"]: result for result in baseline["results"]}
+    regressions = []
+
+    for result in results:
+        before = previous.get(result["case"])
+        if not before:
+            continue
+
+        if result["p50"] > before["p50"] * (1 + tolerance):
+            regressions.append(f"{result['case']}: p50 {before['p50'] * 1000:.3f}ms -> {result['p50'] * 1000:.3f}ms")
+
+    return regressions
+
+
+def main(arguments: t.Optional[list[str]]=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the circuit simulation.")
+    parser.add_argument("--output", help="file the results are written to")
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINES), help="engines to time, defaults to bitwise")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--filter", default="", help="only run cases whose name contains this")
+    parser.add_argument("--baseline", help="earlier results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown against the baseline")
+    arguments = parser.parse_args(arguments)
+
+    if arguments.output and arguments.baseline and os.path.abspath(arguments.output) == os.path.abspath(arguments.baseline):
+        parser.error("--output would overwrite the --baseline it is compared against.")
+
+    # Read before running, so a missing or broken baseline fails before the benchmark does its work.
+    baseline = None
+    if arguments.baseline:
+        with open(arguments.baseline, "rb") as file:
+            baseline = orjson.loads(file.read())
+
+    results = []
+    for engine in arguments.engine or ["bitwise"]:
+        for name, options in CASES:
+            for inputs, outputs in TABLES:
+                if arguments.filter not in get_label(name, options, inputs, outputs, engine):
+                    continue
+
+                result = run_case(name, options, inputs, outputs, engine, arguments.repeat)
+                results.append(result)
+                print(f"{result['case']:<45} p50 {result['p50'] * 1000:9.3f}ms  p99 {result['p99'] * 1000:9.3f}ms  {result['rows_per_second']:12.0f} rows/s  {result['gates_per_second']:12.0f} gates/s  {result['peak_memory'] / 1024:9.1f}KiB")
+
+    report = {
+        "created_on": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    if arguments.output:
+        with open(arguments.output, "wb") as file:
+            file.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+
+    if not baseline:
+        return 0
+
+    regressions = compare(results, baseline, arguments.tolerance)
+
+    for regression in regressions:
+        print(f"regression {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,99 @@
+"""
+Generates snowflake ids from several processes with several threads each
+and checks that none of them collide.
+
+    python -m benchmarks.snowflakes --processes 4 --threads 4 --ids 500000
+
+Every process gets its own machine id, like every worker gets its own
+SNOWFLAKE_MACHINE_ID. --rollback sets the clock back every so often,
+--shared-machine-id gives every process the same machine id, which is
+expected to collide. Exits with 1 on collisions or ids that don't increase.
+"""
+from bit_battles.utils.snowflakes import SnowflakeGenerator
+
+from concurrent.futures import ProcessPoolExecutor
+
+import typing as t
+import threading
+import itertools
+import argparse
+import tempfile
+import array
+import time
+import sys
+import os
+
+
+def _rolling_back_clock(every: int, milliseconds: int) -> t.Callable[[], int]:
+    calls = itertools.count()
+    timestamp = SnowflakeGenerator.timestamp
+
+    def clock() -> int:
+        return timestamp() - (next(calls) // every) * milliseconds
+
+    return clock
+
+
+def _generate(machine_id: int, threads: int, ids: int, rollback: bool, directory: str) -> tuple[str, bool, float]:
+    SnowflakeGenerator.machine_id = machine_id
+    if rollback:
+        SnowflakeGenerator.timestamp = staticmethod(_rolling_back_clock(50000, 50))
+
+    results = [array.array("Q") for _ in range(threads)]
+
+    def run(result: array.array) -> None:
+        result.extend(SnowflakeGenerator.generate_id() for _ in range(ids // threads))
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=run, args=(result,)) for result in results]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    duration = time.perf_counter() - start
+
+    # Ids of one generator only ever increase, within a thread too.
+    increasing = all(all(a < b for a, b in zip(result, result[1:])) for result in results)
+
+    path = os.path.join(directory, f"{os.getpid()}-{machine_id}.ids")
+    with open(path, "wb") as file:
+        for result in results:
+            result.tofile(file)
+
+    return path, increasing, duration
+
+
+def main(arguments: t.Optional[list[str]]=None) -> int:
+    parser = argparse.ArgumentParser(description="Check snowflake ids for collisions across processes.")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4, help="threads per process")
+    parser.add_argument("--ids", type=int, default=500000, help="ids per process")
+    parser.add_argument("--rollback", action="store_true", help="set the clock back 50ms every 50000 ids")
+    parser.add_argument("--shared-machine-id", action="store_true", help="give every process the same machine id")
+    args = parser.parse_args(arguments)
+
+    with tempfile.TemporaryDirectory() as directory:
+        with ProcessPoolExecutor(args.processes) as executor:
+            futures = [
+                executor.submit(_generate, 1 if args.shared_machine_id else index + 1, args.threads, args.ids, args.rollback, directory)
+                for index in range(args.processes)
+            ]
+            results = [future.result() for future in futures]
+
+        ids = array.array("Q")
+        for path, _, _ in results:
+            with open(path, "rb") as file:
+                ids.frombytes(file.read())
+
+    collisions = len(ids) - len(set(ids))
+    increasing = all(result[1] for result in results)
+    rate = sum(args.ids / result[2] for result in results)
+
+    print(f"{len(ids)} ids from {args.processes} processes with {args.threads} threads, {rate:,.0f} ids/s")
+    print(f"{collisions} collisions, ids {'increase' if increasing else 'do not increase'} per thread")
+
+    return 1 if collisions or not increasing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
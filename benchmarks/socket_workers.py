@@ -0,0 +1,145 @@
+"""
+Checks that a battle delta emitted by one worker reaches a client connected
+to another worker through the Socket.IO message queue.
+
+    flask db upgrade
+    python -m benchmarks.socket_workers [--queue sqlite:///instance/socketio.sqlite3]
+
+Starts two workers on the app's database, connects a player's socket to
+worker B and starts the battle through worker A. Battle routing is turned
+off for the workers, otherwise worker B would refuse the socket of a battle
+it doesn't own. Needs the client extra of python-socketio, exits with 1
+when the delta doesn't arrive.
+"""
+from bit_battles.battles.models import Battle, Player
+from bit_battles.auth.models import User
+from bit_battles.extensions import db, socketio
+from bit_battles import create_app
+
+import typing as t
+import subprocess
+import argparse
+import secrets
+import socket
+import time
+import sys
+import os
+
+
+def _serve(port: int) -> None:
+    socketio.run(create_app(), host="127.0.0.1", port=port, log_output=False)
+
+
+def _start_worker(port: int, queue: str) -> subprocess.Popen:
+    env = dict(os.environ, SOCKETIO_MESSAGE_QUEUE=queue, BATTLE_WORKERS="1", WORKER_INDEX="0")
+    worker = subprocess.Popen([sys.executable, "-m", "benchmarks.socket_workers", "--serve", str(port)], env=env)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return worker
+        except OSError:
+            time.sleep(0.2)
+
+    worker.kill()
+    raise RuntimeError(f"Worker on port {port} didn't start.")
+
+
+def _create_battle() -> tuple[str, dict[str, str]]:
+    owner, player = User(secrets.token_hex(8), f"host-{secrets.token_hex(4)}"), User(secrets.token_hex(8), f"player-{secrets.token_hex(4)}")
+    db.session.add_all([owner, player])
+    db.session.commit()
+
+    battle = Battle(owner.id, 2, 1)
+    db.session.add(battle)
+    db.session.add_all([Player(battle_id=battle.id, user_id=owner.id), Player(battle_id=battle.id, user_id=player.id)])
+    db.session.commit()
+
+    return battle.id, {"owner_id": owner.id, "player_id": player.id, "token": owner.set_battle_token()}
+
+
+def _delete_battle(battle_id: str, users: dict[str, str]) -> None:
+    Player.query.filter_by(battle_id=battle_id).delete()
+    Battle.query.filter_by(id=battle_id).delete()
+    User.query.filter(User.id.in_([users["owner_id"], users["player_id"]])).delete()
+    db.session.commit()
+
+
+def _receive_delta(battle_id: str, users: dict[str, str], ports: tuple[int, int], timeout: float) -> t.Optional[dict]:
+    import socketio as client
+    import requests
+
+    deltas: list[dict] = []
+    connection = client.Client()
+    connection.on("battle_delta", deltas.append)
+
+    joined = []
+    connection.on("battle_snapshot", joined.append)
+
+    connection.connect(f"http://127.0.0.1:{ports[1]}?battle={battle_id}", transports=["websocket"])
+    connection.emit("join", {"battle_id": battle_id, "player_id": users["player_id"]})
+
+    try:
+        deadline = time.time() + timeout
+        while not joined and time.time() < deadline:
+            time.sleep(0.05)
+
+        if not joined:
+            print("No snapshot from worker B.")
+            return None
+
+        response = requests.post(
+            f"http://127.0.0.1:{ports[0]}/api/battle/{battle_id}/start",
+            headers={"Authorization": f"Bearer {users['token']}"}
+        )
+        print(f"Started the battle on worker A: {response.status_code}")
+
+        while not deltas and time.time() < deadline:
+            time.sleep(0.05)
+
+        return deltas[0] if deltas else None
+
+    finally:
+        connection.disconnect()
+
+
+def main(arguments: t.Optional[list[str]]=None) -> int:
+    parser = argparse.ArgumentParser(description="Check that socket events reach clients on other workers.")
+    parser.add_argument("--queue", default="sqlite:///instance/socketio.sqlite3", help="message queue the workers share")
+    parser.add_argument("--ports", type=int, nargs=2, default=(5016, 5017), help="ports of worker A and B")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(arguments)
+
+    if args.serve:
+        _serve(args.serve)
+        return 0
+
+    app = create_app()
+    with app.app_context():
+        battle_id, users = _create_battle()
+
+    workers = []
+    try:
+        workers = [_start_worker(port, args.queue) for port in args.ports]
+        delta = _receive_delta(battle_id, users, args.ports, args.timeout)
+
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+
+        with app.app_context():
+            _delete_battle(battle_id, users)
+
+    if not delta:
+        print("The delta didn't reach worker B.")
+        return 1
+
+    print(f"Worker B received {delta['type']} ({delta['data'].get('stage')}).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,14 @@
 from bit_battles.api.challenge.views import challenge_api_blueprint
 from bit_battles.challenges.views import challenges_blueprint 
+from bit_battles.challenges.commands import challenges_cli
 from bit_battles.api.battle.views import battle_api_blueprint
 from bit_battles.circuits.views import circuits_blueprint 
+from bit_battles.circuits.commands import circuits_cli
 from bit_battles.battles.events import register_events
-from bit_battles.battles.models import Battle, Player
+from bit_battles.utils.messages import message_queue_options
+from bit_battles.utils.storage import init_circuits_db
+from bit_battles.battles.rooms import battle_rooms
+from bit_battles.battles.models import Player
 from bit_battles.battles.views import battle_blueprint
 from bit_battles.auth.models import User
 from bit_battles.main.views import main_blueprint
@@ -11,7 +16,7 @@ from bit_battles.auth.views import auth_blueprint
 from bit_battles.app.views import app_blueprint
 
 from .extensions import db, socketio, cache
-from .config import DEBUG, SECRET_KEY
+from .config import DEBUG, SECRET_KEY, SOCKETIO_MESSAGE_QUEUE
 
 from flask_migrate import Migrate
 from flask_login import LoginManager, current_user, AnonymousUserMixin
@@ -32,6 +37,9 @@ def create_app() -> Flask:
     app.register_blueprint(auth_blueprint)
     app.register_blueprint(app_blueprint)
 
+    app.cli.add_command(challenges_cli)
+    app.cli.add_command(circuits_cli)
+
     register_events(socketio)
 
     app.config["DEBUG"] = DEBUG
@@ -44,7 +52,9 @@ def create_app() -> Flask:
     db.init_app(app)
     cache.init_app(app)
     migrate.init_app(app, db)
-    socketio.init_app(app)
+    socketio.init_app(app, **message_queue_options(SOCKETIO_MESSAGE_QUEUE))
+    battle_rooms.init_app(app)
+    init_circuits_db()
 
     @login_manager.user_loader
     def load_user(user_id):
@@ -68,17 +78,14 @@ def create_app() -> Flask:
         if not player:
             return
 
-        battle: t.Optional[Battle] = Battle.query.get(player.battle_id)
-        if not battle:
+        room = battle_rooms.get(player.battle_id)
+        if not room:
             return
         
-        if battle.owner_id == current_user.id:  
-            db.session.delete(battle)
-            socketio.emit("disband", to=battle.id)
+        if room.owner_id == current_user.id:  
+            battle_rooms.disband(room)
+            socketio.emit("disband", to=room.id)
         else:
-            battle.players.remove(current_user)
-            socketio.emit("player_leave", {"id": current_user.id}, to=battle.id)
-        
-        db.session.commit()
+            battle_rooms.leave(room, current_user.id)
 
     return app
\ No newline at end of file
@@ -1,190 +1,165 @@
-from bit_battles.utils.decorators import battle_authorized
-from bit_battles.battles.models import Battle, Player
+from bit_battles.utils.decorators import battle_authorized, battle_routed
+from bit_battles.battles.rooms import battle_rooms
 from bit_battles.utils.circuit import Circuit
-from bit_battles.utils.battle import TableGenerator, Simulate
+from bit_battles.utils.battle import TableGenerator
+from bit_battles.utils.verdicts import verify
+from bit_battles.utils.pool import PoolSaturated
 from bit_battles.auth.models import User
-from bit_battles.extensions import db, socketio
+from bit_battles.extensions import socketio
 
 from flask import Blueprint, g, request
 
-import typing as t
 import time
-import json
 
 
 battle_api_blueprint = Blueprint("api", __name__, url_prefix="/api")
 
 
 @battle_api_blueprint.delete("/battle/<string:id>/leave")
+@battle_routed
 @battle_authorized
 def leave_battle(id):
     user: User = g.user
-    player: t.Optional[Player] = Player.query.filter_by(battle_id=id, user_id=user.id).first()
-    if not player:
+    room = battle_rooms.get(id)
+    if not room or user.id not in room.players:
         return {"error": "You are not in this battle."}, 400
     
-    battle: t.Optional[Battle] = Battle.query.get(id)
-    if not battle:
-        return {"error": "This battle does not exist."}, 400
-    
-    if battle.owner_id == user.id:
-        db.session.delete(battle)
-        socketio.emit("disband", to=battle.id)
+    if room.owner_id == user.id:
+        battle_rooms.disband(room)
+        socketio.emit("disband", to=room.id)
     else:
-        battle.players.remove(user)
-        socketio.emit("player_leave", {"id": user.id}, to=battle.id)
+        battle_rooms.leave(room, user.id)
     
-    db.session.commit()
     return {"success": True}, 204
 
 
 @battle_api_blueprint.post("/battle/<string:id>/start")
+@battle_routed
 @battle_authorized
 def start_battle(id):
-    battle: t.Optional[Battle] = Battle.query.get(id)
-    if not battle:
+    room = battle_rooms.get(id)
+    if not room:
         return {"error": "Battle not found."}, 400
     
     user: User = g.user
-    if battle.owner_id != user.id:
+    if room.owner_id != user.id:
         return {"error": "You are not hosting this battle."}, 400
     
-    if battle.players.count() < 2: # type: ignore
+    if len(room.players) < 2:
         return {"error": "Not enough players."}, 400
     
-    table = TableGenerator(battle.inputs, battle.outputs, None).table
-    battle.truthtable = json.dumps(table)
-    battle.stage = "battle"
-    battle.started_on = time.time() + 3
-    db.session.commit()
-    
-    socketio.emit("update_battle", battle.serialize(), to=battle.id)
+    battle_rooms.start(room, TableGenerator(room.inputs, room.outputs, None).table)
     return {"success": True}, 204
 
 
 @battle_api_blueprint.post("/battle/<string:id>/restart")
+@battle_routed
 @battle_authorized
 def restart_battle(id):
-    battle: t.Optional[Battle] = Battle.query.get(id)
-    if not battle:
+    room = battle_rooms.get(id)
+    if not room:
         return {"error": "Battle not found."}, 400
     
     user: User = g.user
-    if battle.owner_id != user.id:
+    if room.owner_id != user.id:
         return {"error": "You are not hosting this battle."}, 400
     
-    if battle.players.count() < 2: # type: ignore
+    if len(room.players) < 2:
         return {"error": "Not enough players."}, 400
     
-    for player in Player.query.filter_by(battle_id=battle.id).all():
-        player.gates = 0
-        player.attempts = 0
-        player.submission_on = 0
-        player.passed = False
-        player.score = 0
-
-    battle.stage = "queue"
-    db.session.commit()
-    
-    socketio.emit("update_battle", battle.serialize(), to=battle.id)
+    battle_rooms.restart(room)
     return {"success": True}, 204
 
 
 @battle_api_blueprint.post("/battle/<string:id>/submit")
+@battle_routed
 @battle_authorized
 def submit(id):
     if not request.json:
         return {"error": "Invalid body."}, 400
 
     user: User = g.user
-    player: t.Optional[Player] = Player.query.filter_by(battle_id=id, user_id=user.id).first()
-    if not player:
+    room = battle_rooms.get(id)
+    player = room.players.get(user.id) if room else None
+    if not room or not player:
         return {"error": "You are not in this battle."}, 400
     
     if player.passed:
         return {"error": "You already submitted successfully."}, 400
-
-    battle: t.Optional[Battle] = Battle.query.get(id)
-    if not battle:
-        return {"error": "Battle not found."}, 400
     
     gates, wires = request.json.get("gates"), request.json.get("wires")
 
     if not gates or not wires:
         return {"error": "Invalid circuit."}, 400
 
-    player.attempts += 1
-
     try:
-        passed, longest_path = Simulate(
+        passed, longest_path, feedback = verify(
             gates, 
             wires,
-            {}
-            ).test(json.loads(battle.truthtable))
+            {},
+            room.table
+            )
 
-        gates_used = len(gates) - battle.inputs - battle.outputs
+    except PoolSaturated as e:
+        return {"error": str(e)}, 503, {"Retry-After": str(e.retry_after)}
 
-        player.gates = gates_used
-        player.longest_path = longest_path
+    except Exception as e:
+        with room.lock:
+            player.attempts += 1
+            room.touch()
+
+        return {"error": str(e)}, 400
 
+    with room.lock:
+        player.attempts += 1
+        player.gates = len(gates) - room.inputs - room.outputs
+        player.longest_path = longest_path
         player.submission_on = time.time()
         player.passed = passed
+        room.touch()
 
-    except Exception as e:
-        db.session.commit()
-        return {"error": str(e)}, 400
-
-    players = battle.players.count()
-    players_passed = Player.query.filter(Player.battle_id == player.battle_id, Player.attempts > 0, Player.passed == True).count()
-    
     if passed:
-        success, id = Circuit(gates, wires).save("battle", battle.id, player.user_id)
+        success, id = Circuit(gates, wires).save("battle", room.id, player.user_id)
         if success:
-            player.circuit_id = id
+            player.circuit_id = str(id)
+            room.touch()
 
-        socketio.emit("finish", {"id": user.id, "username": user.username, "submission_on": player.submission_on, "gates": player.gates, "longest_path": player.longest_path}, to=player.battle_id)
+        battle_rooms.broadcast(room, "player_passed", room.serialize_player(player))
 
-    if players_passed + 1 == min(players, 3):
-        socketio.emit("give_up", to=battle.id)
-        db.session.commit()
-        return {"passed": passed}, 200
+    with room.lock:
+        players = len(room.players)
+        players_passed = room.passed_count()
 
-    if (players_passed == 2 and players == 2) or players_passed == 3:
-        battle.score_players()
-        battle.stage = "results"
-        socketio.emit("update_battle", battle.serialize(), to=battle.id)
+        if players_passed + 1 == min(players, 3):
+            socketio.emit("give_up", to=room.id)
+            return {"passed": passed, "feedback": feedback}, 200
 
-    db.session.commit()
-    return {"passed": passed}, 200
+        if (players_passed == 2 and players == 2) or players_passed == 3:
+            battle_rooms.finish(room)
+
+    return {"passed": passed, "feedback": feedback}, 200
 
 
 @battle_api_blueprint.patch("/battle/<string:id>/give-up")
+@battle_routed
 @battle_authorized
 def give_up(id):
-    battle: t.Optional[Battle] = Battle.query.get(id)
-    if not battle:
+    room = battle_rooms.get(id)
+    if not room:
         return {"error": "Battle not found."}, 400
     
     user: User = g.user
-    player: t.Optional[Player] = Player.query.filter_by(battle_id=id, user_id=user.id).first()
-    if not player:
+    if user.id not in room.players:
         return {"error": "You are not in this battle."}, 400
 
-    players_passed = Player.query.filter(Player.battle_id == player.battle_id, Player.attempts > 0, Player.passed == True).count() + 1
-    players = battle.players.count()
+    with room.lock:
+        players_passed = room.passed_count() + 1
+        players = len(room.players)
 
-    if players_passed < min(players, 3):
-        return {"error": "You can't yet give up."}, 400
-    
-    user: User = g.user
-    player: t.Optional[Player] = Player.query.filter_by(battle_id=id, user_id=user.id).first()
-    if not player:
-        return {"error": "You are not in this battle."}, 400
-    
-    if (players_passed == 2 and players == 2) or players_passed == 3:
-        battle.score_players()
-        battle.stage = "results"
-        socketio.emit("update_battle", battle.serialize(), to=battle.id)
+        if players_passed < min(players, 3):
+            return {"error": "You can't yet give up."}, 400
+        
+        if (players_passed == 2 and players == 2) or players_passed == 3:
+            battle_rooms.finish(room)
     
-    db.session.commit()
     return {"success": True}, 204
@@ -1,10 +1,12 @@
-from bit_battles.challenges.models import DailyChallengeStatistic, DailyChallenge, Challenge, ChallengeStatistic
+from bit_battles.challenges.models import DailyChallengeStatistic, DailyChallenge, DailyStreak, Challenge, ChallengeStatistic
+from bit_battles.challenges.functions import record_daily_pass, record_challenge_pass
 from bit_battles.utils.decorators import user_authorized
 from bit_battles.utils.circuit import Circuit
-from bit_battles.utils.battle import Simulate
+from bit_battles.utils.verdicts import verify, verdict_cache, simulation_pool
+from bit_battles.utils.pool import PoolSaturated
 from bit_battles.utils.forms import validate_int
 from bit_battles.auth.models import User
-from bit_battles.extensions import db, cache
+from bit_battles.extensions import db
 
 from sqlalchemy import func
 from datetime import datetime
@@ -48,11 +50,12 @@ def daily_submit(date):
     challenge_statistic.attempts += 1
 
     try:
-        passed, longest_path = Simulate(
+        passed, longest_path, feedback = verify(
             gates, 
             wires,
-            {}
-            ).test(json.loads(challenge.truthtable))
+            {},
+            json.loads(challenge.truthtable)
+            )
 
         gates_used = len(gates) - 5
 
@@ -66,11 +69,18 @@ def daily_submit(date):
                 challenge_statistic.circuit = id
 
             challenge_statistic.duration = time.time() - challenge_statistic.started_on
-
-            cache.delete(f"daily:{date}")
+            DailyStreak.record_pass(user.id, challenge.date)
 
         db.session.commit()
-        return {"passed": challenge_statistic.passed}, 200
+
+        if passed:
+            record_daily_pass(challenge_statistic)
+
+        return {"passed": challenge_statistic.passed, "feedback": feedback}, 200
+
+    except PoolSaturated as e:
+        db.session.rollback()
+        return {"error": str(e)}, 503, {"Retry-After": str(e.retry_after)}
 
     except Exception as e:
         db.session.commit()
@@ -147,11 +157,12 @@ def challenge_submit(challenge_id):
             "XOR": challenge.xor_gates
         }
 
-        passed, longest_path = Simulate(
+        passed, longest_path, feedback = verify(
             gates, 
             wires,
-            gate_limits
-            ).test(json.loads(challenge.truthtable))
+            gate_limits,
+            json.loads(challenge.truthtable)
+            )
 
         gates_used = len(gates) - challenge.inputs - challenge.outputs
 
@@ -165,10 +176,18 @@ def challenge_submit(challenge_id):
                 challenge_statistic.circuit = id
 
             challenge_statistic.duration = time.time() - challenge_statistic.started_on
-            cache.delete(f"challenge:{challenge_id}")
+            challenge.users_finished = Challenge.users_finished + 1
 
         db.session.commit()
-        return {"passed": challenge_statistic.passed}, 200
+
+        if passed:
+            record_challenge_pass(challenge_statistic)
+
+        return {"passed": challenge_statistic.passed, "feedback": feedback}, 200
+
+    except PoolSaturated as e:
+        db.session.rollback()
+        return {"error": str(e)}, 503, {"Retry-After": str(e.retry_after)}
 
     except Exception as e:
         db.session.commit()
@@ -237,6 +256,13 @@ def rate_challenge(challenge_id):
     db.session.commit()
 
     return {"success": "True."}, 204
-    
-    
-    
\ No newline at end of file
+
+
+@challenge_api_blueprint.get("/simulation/stats")
+@user_authorized
+def simulation_stats():
+    user: User = g.user
+    if not user.moderator:
+        return {"error": "You are not a moderator."}, 403
+
+    return {"verdicts": verdict_cache.stats(), "pool": simulation_pool.stats()}, 200
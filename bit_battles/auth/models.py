@@ -11,6 +11,10 @@ import time
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index("ix_users_token", "token"),
+        db.Index("ix_users_battle_token", "battle_token"),
+    )
     
     # Authentication
     id = db.Column(db.String(128), primary_key=True, default=SnowflakeGenerator.generate_id)
@@ -28,6 +32,15 @@ class User(UserMixin, db.Model):
         self.username = username
         self.creation_timestamp = time.time()
 
+    @classmethod
+    def get_usernames(cls, user_ids: t.Iterable[str]) -> dict[str, str]:
+        """Usernames of all given users in one query, users that don't exist are left out."""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return {}
+
+        return dict(db.session.query(cls.id, cls.username).filter(cls.id.in_(user_ids)).all())
+
     def set_password(self, password):
         self.password = generate_password_hash(password)
     
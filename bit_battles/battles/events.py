@@ -1,21 +1,37 @@
-from bit_battles.battles.models import Player
-from bit_battles.auth.models import User
+from bit_battles.battles.rooms import battle_rooms, BattleRoom
+from bit_battles.utils.battle import owns_battle
 
-from flask_socketio import SocketIO, join_room
+from flask_socketio import SocketIO, join_room, emit
 
 import typing as t
 
 
+def _get_room(data: dict) -> t.Optional[BattleRoom]:
+    if not owns_battle(data["battle_id"]):
+        return None
+
+    room = battle_rooms.get(data["battle_id"])
+    if not room or data["player_id"] not in room.players:
+        return None
+
+    return room
+
+
 def register_events(socketio: SocketIO):
     @socketio.on('join')
     def join(data: dict):
-        player: t.Optional[Player] = Player.query.filter_by(battle_id=data["battle_id"], user_id=data["player_id"]).first()
-        if not player:
+        room = _get_room(data)
+        if not room:
             return
-        
-        user: t.Optional[User] = User.query.get(player.user_id)
-        if not user:
+
+        # Joined first, so any delta sent after the snapshot reaches this client.
+        join_room(room.id)
+        emit("battle_snapshot", room.serialize())
+
+    @socketio.on('resync')
+    def resync(data: dict):
+        room = _get_room(data)
+        if not room:
             return
 
-        join_room(player.battle_id)
-        socketio.emit("player_join", {"id": user.id, "username": user.username}, to=player.battle_id)
+        emit("battle_snapshot", room.serialize())
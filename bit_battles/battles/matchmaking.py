@@ -0,0 +1,265 @@
+from bit_battles.battles.models import Battle, Player, BattleStatistic
+from bit_battles.extensions import db
+from bit_battles.config import MATCHMAKING_BATTLE_SIZE, MATCHMAKING_RATING_BAND, MATCHMAKING_SYNC_INTERVAL, MATCHMAKING_CLAIM_TIMEOUT
+
+from collections import OrderedDict
+
+import typing as t
+import threading
+import json
+import time
+
+
+# (inputs, outputs, gates)
+Configuration = tuple[int, int, tuple[str, ...]]
+
+
+def get_configuration(inputs: int, outputs: int, gates: t.Union[str, list[str]]) -> Configuration:
+    if isinstance(gates, str):
+        gates = json.loads(gates)
+
+    return (inputs, outputs, tuple(sorted(gates)))
+
+
+def get_rating(user_id: str) -> t.Optional[float]:
+    return BattleStatistic.get_ratings([user_id]).get(user_id)
+
+
+class Lobby:
+    __slots__ = ("battle_id", "configuration", "ratings", "claims", "queue", "opened_on")
+
+    def __init__(self, battle_id: str, configuration: Configuration) -> None:
+        self.battle_id = battle_id
+        self.configuration = configuration
+        # Rating of every player in the lobby, None for players without battles.
+        self.ratings: dict[str, t.Optional[float]] = {}
+        # When players who claimed a seat but haven't joined yet claimed it.
+        self.claims: dict[str, float] = {}
+        self.queue: t.Optional[tuple] = None
+        self.opened_on = time.time()
+
+    @property
+    def rating(self) -> t.Optional[float]:
+        ratings = [rating for rating in self.ratings.values() if rating is not None]
+        return sum(ratings) / len(ratings) if ratings else None
+
+
+class Matchmaker:
+    """
+    Public battles waiting for players. Lobbies are queued per configuration
+    and rating band, and within those by how many players they have, so the
+    fullest lobby is found without going through the others and every lobby
+    fills up to `capacity` before the next one gets players.
+
+    With a `band`, lobbies whose players are rated within it of the joining
+    player come first. A rating is the average score of a user's battles.
+
+    Battle rooms report joins, leaves and stage changes. Lobbies are rebuilt
+    from the tables every `sync_interval` seconds, which picks up battles of
+    other workers. Claimed seats are kept until the player joins or
+    `claim_timeout` seconds have passed.
+    """
+
+    def __init__(self, capacity: int, band: float=0, sync_interval: t.Optional[float]=None, claim_timeout: float=30) -> None:
+        self._capacity = capacity
+        self._band = band
+        self._sync_interval = sync_interval
+        self._claim_timeout = claim_timeout
+        self._lobbies: dict[str, Lobby] = {}
+        # (configuration, band) -> lobbies by their number of players
+        self._queues: dict[tuple, list[OrderedDict[str, Lobby]]] = {}
+        # Battles closed while a sync was reading the tables, those rows are already out of date.
+        self._closed: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._synced_on = 0.0
+
+    def _band_of(self, rating: t.Optional[float]) -> t.Optional[int]:
+        if not self._band or rating is None:
+            return None
+
+        return int(rating // self._band)
+
+    def _expire(self, lobby: Lobby, now: float) -> None:
+        for user_id, claimed_on in list(lobby.claims.items()):
+            if now - claimed_on > self._claim_timeout:
+                del lobby.claims[user_id]
+                lobby.ratings.pop(user_id, None)
+
+    def _dequeue(self, lobby: Lobby) -> None:
+        if lobby.queue:
+            key, players = lobby.queue
+            self._queues[key][players].pop(lobby.battle_id, None)
+            lobby.queue = None
+
+    def _requeue(self, lobby: Lobby) -> None:
+        self._dequeue(lobby)
+
+        players = len(lobby.ratings)
+        if players >= self._capacity:
+            return
+
+        key = (lobby.configuration, self._band_of(lobby.rating))
+        if key not in self._queues:
+            self._queues[key] = [OrderedDict() for _ in range(self._capacity)]
+
+        self._queues[key][players][lobby.battle_id] = lobby
+        lobby.queue = (key, players)
+
+    def _tiers(self, configuration: t.Optional[Configuration], rating: t.Optional[float]) -> list[list[tuple]]:
+        keys = [key for key in self._queues if configuration is None or key[0] == configuration]
+
+        band = self._band_of(rating)
+        if band is None:
+            return [keys]
+
+        # A rating near the edge of its band is as close to the neighbouring band.
+        near = [key for key in keys if key[1] is not None and abs(key[1] - band) <= 1]
+        return [near, [key for key in keys if key not in near]]
+
+    def open(self, battle_id: str, configuration: Configuration, ratings: dict[str, t.Optional[float]]) -> None:
+        """Queues a public battle that is waiting for players."""
+        with self._lock:
+            lobby = self._lobbies.get(battle_id) or Lobby(battle_id, configuration)
+            lobby.ratings.update(ratings)
+
+            self._lobbies[battle_id] = lobby
+            self._requeue(lobby)
+
+    def close(self, battle_id: str) -> None:
+        """Takes a battle out of the queues, once it started or was disbanded."""
+        with self._lock:
+            lobby = self._lobbies.pop(battle_id, None)
+            if lobby:
+                self._dequeue(lobby)
+
+            self._closed[battle_id] = time.time()
+
+    def claim(self, configuration: t.Optional[Configuration], user_id: str, rating: t.Optional[float]) -> t.Optional[str]:
+        """
+        Seats the user in the fullest lobby that isn't full yet, the oldest
+        one when there are several, and returns its battle id. Any
+        configuration is fine when none is given.
+        """
+        with self._lock:
+            for tier in self._tiers(configuration, rating):
+                for players in range(self._capacity - 1, 0, -1):
+                    for key in tier:
+                        lobbies = self._queues[key][players]
+                        if not lobbies:
+                            continue
+
+                        lobby = next(iter(lobbies.values()))
+                        lobby.ratings[user_id] = rating
+                        lobby.claims[user_id] = time.time()
+                        self._requeue(lobby)
+
+                        return lobby.battle_id
+
+        return None
+
+    def arrived(self, battle_id: str, user_id: str) -> bool:
+        """Turns the user's claimed seat into a player, returns whether they had a seat."""
+        with self._lock:
+            lobby = self._lobbies.get(battle_id)
+            if not lobby or user_id not in lobby.ratings:
+                return False
+
+            lobby.claims.pop(user_id, None)
+            return True
+
+    def joined(self, battle_id: str, user_id: str, rating: t.Optional[float]) -> bool:
+        """Seats a user who joined without claiming, returns False when the seats left are all claimed."""
+        with self._lock:
+            lobby = self._lobbies.get(battle_id)
+            if not lobby or user_id in lobby.ratings:
+                return True
+
+            self._expire(lobby, time.time())
+            if len(lobby.ratings) >= self._capacity:
+                self._requeue(lobby)
+                return False
+
+            lobby.ratings[user_id] = rating
+            self._requeue(lobby)
+            return True
+
+    def left(self, battle_id: str, user_id: str) -> None:
+        with self._lock:
+            lobby = self._lobbies.get(battle_id)
+            if not lobby or lobby.ratings.pop(user_id, False) is False:
+                return
+
+            lobby.claims.pop(user_id, None)
+            self._requeue(lobby)
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = [len(lobbies) for queue in self._queues.values() for lobbies in queue]
+
+            return {"lobbies": len(self._lobbies), "queued": sum(queued)}
+
+    def sync(self) -> None:
+        """
+        Rebuilds the lobbies from the public battles in the queue stage.
+        Claims that haven't expired and lobbies opened since the query
+        are carried over.
+        """
+        started_on = time.time()
+        rows = (
+            db.session.query(Battle.id, Battle.inputs, Battle.outputs, Battle.gates, Player.user_id)
+            .join(Player, Player.battle_id == Battle.id)
+            .filter(Battle.stage == "queue", Battle.private == False)
+            .all()
+        )
+
+        ratings = BattleStatistic.get_ratings(row.user_id for row in rows)
+        lobbies: dict[str, Lobby] = {}
+
+        for row in rows:
+            if row.id not in lobbies:
+                lobbies[row.id] = Lobby(row.id, get_configuration(row.inputs, row.outputs, row.gates))
+
+            lobbies[row.id].ratings[row.user_id] = ratings.get(row.user_id)
+
+        with self._lock:
+            now = time.time()
+
+            for battle_id, closed_on in list(self._closed.items()):
+                if closed_on >= started_on:
+                    lobbies.pop(battle_id, None)
+                else:
+                    del self._closed[battle_id]
+
+            for battle_id, lobby in self._lobbies.items():
+                if battle_id not in lobbies:
+                    if lobby.opened_on >= started_on:
+                        lobbies[battle_id] = lobby
+
+                    continue
+
+                self._expire(lobby, now)
+                for user_id, claimed_on in lobby.claims.items():
+                    if user_id not in lobbies[battle_id].ratings:
+                        lobbies[battle_id].ratings[user_id] = lobby.ratings[user_id]
+                        lobbies[battle_id].claims[user_id] = claimed_on
+
+            self._lobbies = lobbies
+            self._queues.clear()
+
+            for lobby in lobbies.values():
+                self._requeue(lobby)
+
+            self._synced_on = time.time()
+
+    def refresh(self) -> None:
+        """Syncs when the last sync is older than `sync_interval`, once for all requests that notice."""
+        with self._lock:
+            if self._sync_interval is None or time.time() - self._synced_on <= self._sync_interval:
+                return
+
+            self._synced_on = time.time()
+
+        self.sync()
+
+
+matchmaker = Matchmaker(MATCHMAKING_BATTLE_SIZE, MATCHMAKING_RATING_BAND, MATCHMAKING_SYNC_INTERVAL, MATCHMAKING_CLAIM_TIMEOUT)
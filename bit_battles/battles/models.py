@@ -2,10 +2,10 @@ from bit_battles.utils.snowflakes import SnowflakeGenerator
 from bit_battles.utils.functions import relative_timestamp
 from bit_battles.auth.models import User
 from bit_battles.extensions import db
-from bit_battles.config import PATH_WEIGHT, GATE_WEIGHT
 
 from sqlalchemy import func
 
+import typing as t
 import random
 import string
 import json
@@ -18,6 +18,7 @@ BATTLE_ID = string.ascii_letters + string.digits
 
 class Battle(db.Model):
     __tablename__ = "battles"
+    __table_args__ = (db.Index("ix_battles_stage_private", "stage", "private"),)
 
     id = db.Column(db.String(5), primary_key=True)
     owner_id = db.Column(db.String(128), db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -45,102 +46,10 @@ class Battle(db.Model):
         self.private = private
         self.set_id()
 
-    def _get_players(self) -> list:
-        players = []
-
-        for user in self.players.order_by(Player.score.desc()): # type: ignore
-            data = user.serialize()
-            player = Player.query.filter_by(battle_id=self.id, user_id=user.id).first()
-
-            if not player:
-                continue
-
-            data.update(player.serialize())
-            data["time"] = round(player.submission_on - self.started_on, 3)
-            players.append(data)
-
-        return players
-    
-    def score_players(self) -> None:
-        metrics = (
-            db.session.query(
-                func.min(Player.longest_path),
-                func.min(Player.gates),
-                func.max(Player.submission_on)
-            )
-            .filter(Player.battle_id == self.id, Player.passed == True)
-            .first()
-        )
-
-        if not metrics:
-            return
-
-        shortest_path, least_gates, longest_submission_on = metrics
-        shortest_path = shortest_path * PATH_WEIGHT
-        least_gates = least_gates * GATE_WEIGHT
-        longest_duration = (longest_submission_on - self.started_on)
-
-        players = Player.query.filter_by(battle_id=self.id).all()
-        highest_score, winner = None, None
-        battle_data = []
-
-        for player in players:
-            if not player.passed:
-                continue
-
-            player_duration = player.submission_on - self.started_on
-            player.score = round(
-                (shortest_path / max(player.longest_path, 1))
-                + (least_gates / max(player.gates, 1))
-                + (longest_duration / max(player_duration, 1))
-            )
-
-            # Determine winner
-            if not highest_score or player.score > highest_score:
-                highest_score = player.score
-                winner = player
-
-            battle_data.append({
-                "user_id": player.user_id,
-                "gates": player.gates,
-                "attempts": player.attempts,
-                "longest_path": player.longest_path,
-                "duration": round(player.submission_on - self.started_on, 3),
-            })
-
-        battle_statistics = [
-            BattleStatistic(
-                self,
-                player.user_id,
-                player == winner,
-                player.passed,
-                player.gates,
-                player.longest_path,
-                player.attempts,
-                player.submission_on - self.started_on,
-                player.score
-            )
-            for player in players
-            if User.query.get(player.user_id)
-        ]
-
-        db.session.bulk_save_objects(battle_statistics)
-        db.session.commit()
-
-    def serialize(self) -> dict:
-        return {
-            "id": self.id,
-            "owner_id": self.owner_id,
-            "players": self._get_players(),
-            "stage": self.stage,
-            "started_on": self.started_on,
-            "truthtable": json.loads(self.truthtable) if self.truthtable else None,
-            "gates": json.loads(self.gates)
-        }
-
 
 class Player(db.Model):
     __tablename__ = "players"
+    __table_args__ = (db.Index("ix_players_user_id", "user_id"),)
 
     battle_id = db.Column(db.String(128), db.ForeignKey("battles.id", ondelete="CASCADE"), primary_key=True)
     user_id = db.Column(db.String(128), db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
@@ -167,6 +76,7 @@ class Player(db.Model):
 
 class BattleStatistic(db.Model):
     __tablename__ = "battle_statistics"
+    __table_args__ = (db.Index("ix_battle_statistics_user_id_creation_timestamp", "user_id", "creation_timestamp"),)
 
     id = db.Column(db.String(128), primary_key=True, default=SnowflakeGenerator.generate_id)
     user_id = db.Column(db.String(128), db.ForeignKey("users.id", ondelete="CASCADE"))
@@ -182,9 +92,9 @@ class BattleStatistic(db.Model):
 
     creation_timestamp = db.Column(db.Float(), default=0)
 
-    def __init__(self, battle: Battle, user_id: str, winner: bool, passed: bool, gates: int, longest_path: int, attempts: int, duration: float, score: int) -> None:
+    def __init__(self, battle_type: str, user_id: str, winner: bool, passed: bool, gates: int, longest_path: int, attempts: int, duration: float, score: int) -> None:
         self.user_id = user_id
-        self.battle_type = f"{battle.inputs}-{battle.outputs}-{','.join(json.loads(battle.gates))}"
+        self.battle_type = battle_type
         self.winner = winner
         self.passed = passed
         self.gates = gates
@@ -212,17 +122,33 @@ class BattleStatistic(db.Model):
             "relative_timestamp": relative_timestamp(self.creation_timestamp),
         }
     
-    def leaderboard_serialize(self) -> dict:
-        user = User.query.with_entities(
-            User.username # type: ignore
-        ).filter_by(id=self.user_id).first()
-        if not user:
+    @classmethod
+    def get_ratings(cls, user_ids: t.Iterable[str]) -> dict[str, float]:
+        """Average battle score of all given users in one query, users without battles are left out."""
+        user_ids = set(user_ids)
+        if not user_ids:
             return {}
 
+        return dict(db.session.query(cls.user_id, func.avg(cls.score)).filter(cls.user_id.in_(user_ids)).group_by(cls.user_id).all())
+
+    @classmethod
+    def leaderboard_serialize_all(cls, statistics: list['BattleStatistic']) -> list[dict]:
+        """Leaderboard entries of all statistics, with the usernames fetched in one query."""
+        usernames = User.get_usernames(statistic.user_id for statistic in statistics)
+
+        return [
+            statistic._leaderboard_serialize(usernames[statistic.user_id]) if statistic.user_id in usernames else {}
+            for statistic in statistics
+        ]
+
+    def leaderboard_serialize(self) -> dict:
+        return self.leaderboard_serialize_all([self])[0]
+
+    def _leaderboard_serialize(self, username: str) -> dict:
         relative_time = round(time.time() - self.creation_timestamp)
 
         return {
-            "username": user.username,
+            "username": username,
             "score": self.score,
             "relative_timestamp": f"{relative_time // 60}m {relative_time % 60}s ago"
         }
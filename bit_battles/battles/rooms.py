@@ -0,0 +1,380 @@
+from bit_battles.battles.matchmaking import matchmaker, get_configuration, get_rating
+from bit_battles.battles.models import Battle, Player, BattleStatistic
+from bit_battles.utils.battle import TableGenerator
+from bit_battles.auth.models import User
+from bit_battles.extensions import db, socketio
+from bit_battles.config import PATH_WEIGHT, GATE_WEIGHT, BATTLE_CHECKPOINT_INTERVAL, BATTLE_ROOM_TIMEOUT, MATCHMAKING_BATTLE_SIZE, MATCHMAKING_AUTO_START
+
+from sqlalchemy.exc import SQLAlchemyError
+from flask import Flask
+
+import typing as t
+import threading
+import atexit
+import json
+import time
+
+
+class PlayerState:
+    __slots__ = ("user_id", "username", "circuit_id", "gates", "attempts", "longest_path", "submission_on", "passed", "score")
+
+    def __init__(self, user_id: str, username: str, player: t.Optional[Player]=None) -> None:
+        self.user_id = user_id
+        self.username = username
+        self.circuit_id = player.circuit_id if player else None
+        self.gates = player.gates if player else 0
+        self.attempts = player.attempts if player else 0
+        self.longest_path = player.longest_path if player else 0
+        self.submission_on = player.submission_on if player else 0
+        self.passed = player.passed if player else False
+        self.score = player.score if player else 0
+
+    def apply(self, player: Player) -> None:
+        player.circuit_id = self.circuit_id
+        player.gates = self.gates
+        player.attempts = self.attempts
+        player.longest_path = self.longest_path
+        player.submission_on = self.submission_on
+        player.passed = self.passed
+        player.score = self.score
+
+    def serialize(self) -> dict:
+        return {
+            "id": self.user_id,
+            "username": self.username,
+            "gates": self.gates,
+            "attempts": self.attempts,
+            "longest_path": self.longest_path,
+            "submission_on": self.submission_on,
+            "passed": self.passed,
+            "score": self.score,
+            "circuit_id": self.circuit_id
+        }
+
+
+class BattleRoom:
+    """
+    Live state of a battle and its players. Every change bumps `version`, the
+    room is dirty until a checkpoint has written that version to the database.
+    Changes clients need to see are broadcast as deltas numbered by `sequence`.
+    """
+
+    def __init__(self, battle: Battle, players: list[tuple[Player, str]]) -> None:
+        self.id = battle.id
+        self.owner_id = battle.owner_id
+        self.inputs = battle.inputs
+        self.outputs = battle.outputs
+        self.gates = battle.gates
+        self.private = battle.private
+        self.stage = battle.stage
+        self.started_on = battle.started_on
+        self.truthtable = battle.truthtable
+        self.table = json.loads(battle.truthtable) if battle.truthtable else None
+
+        # Join order, like the rows in the players table.
+        self.players = {player.user_id: PlayerState(player.user_id, username, player) for player, username in players}
+
+        self.lock = threading.RLock()
+        self.version = 0
+        self.checkpointed = 0
+        self.touched_on = time.time()
+
+        # Starts from the clock, so a room rebuilt after a restart never reuses a sequence number clients have seen.
+        self.sequence = int(self.touched_on * 1000)
+
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.checkpointed
+
+    @property
+    def battle_type(self) -> str:
+        return f"{self.inputs}-{self.outputs}-{','.join(json.loads(self.gates))}"
+
+    def touch(self) -> None:
+        self.version += 1
+        self.touched_on = time.time()
+
+    def passed_count(self) -> int:
+        return sum(1 for player in self.players.values() if player.attempts > 0 and player.passed)
+
+    def score_players(self) -> t.Optional[PlayerState]:
+        """Scores the players that passed and returns the winner."""
+        passed = [player for player in self.players.values() if player.passed]
+        if not passed:
+            return None
+
+        shortest_path = min(player.longest_path for player in passed) * PATH_WEIGHT
+        least_gates = min(player.gates for player in passed) * GATE_WEIGHT
+        longest_duration = max(player.submission_on for player in passed) - self.started_on
+
+        highest_score, winner = None, None
+
+        for player in passed:
+            player_duration = player.submission_on - self.started_on
+            player.score = round(
+                (shortest_path / max(player.longest_path, 1))
+                + (least_gates / max(player.gates, 1))
+                + (longest_duration / max(player_duration, 1))
+            )
+
+            # Determine winner
+            if not highest_score or player.score > highest_score:
+                highest_score = player.score
+                winner = player
+
+        return winner
+
+    def serialize_player(self, player: PlayerState) -> dict:
+        data = player.serialize()
+        data["time"] = round(player.submission_on - self.started_on, 3)
+
+        return data
+
+    def serialize(self) -> dict:
+        players = sorted(self.players.values(), key=lambda player: player.score, reverse=True)
+
+        return {
+            "id": self.id,
+            "sequence": self.sequence,
+            "owner_id": self.owner_id,
+            "players": [self.serialize_player(player) for player in players],
+            "stage": self.stage,
+            "started_on": self.started_on,
+            "truthtable": self.table,
+            "gates": json.loads(self.gates)
+        }
+
+
+class BattleRooms:
+    """
+    Keeps the battles this worker is serving in memory, so submits and joins
+    don't have to read the battle back from the database every time.
+
+    Membership and stage changes are written through right away, they are
+    rare and other lookups (which battle is a user in, which battles are
+    queueing) read the tables. Attempts and submissions are checkpointed
+    every `interval` seconds and when the process exits. Rooms that haven't
+    been touched for `timeout` seconds are dropped, any room that isn't in
+    memory, for example after a restart, is rebuilt from the database.
+    """
+
+    def __init__(self, interval: float, timeout: float) -> None:
+        self._interval = interval
+        self._timeout = timeout
+        self._rooms: dict[str, BattleRoom] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: t.Optional[threading.Thread] = None
+        self._app: t.Optional[Flask] = None
+        self._closed = False
+
+    def init_app(self, app: Flask) -> None:
+        self._app = app
+
+    def _start(self) -> None:
+        if self._thread or self._closed:
+            return
+
+        self._thread = threading.Thread(target=self._run, name="battle-checkpoints", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            self.checkpoint_all()
+
+    def _load(self, id: str) -> t.Optional[BattleRoom]:
+        battle: t.Optional[Battle] = Battle.query.get(id)
+        if not battle:
+            return None
+
+        players = (
+            db.session.query(Player, User.username)
+            .join(User, User.id == Player.user_id)
+            .filter(Player.battle_id == id)
+            .all()
+        )
+
+        return BattleRoom(battle, players)
+
+    def get(self, id: str) -> t.Optional[BattleRoom]:
+        with self._lock:
+            room = self._rooms.get(id)
+            if room:
+                return room
+
+            room = self._load(id)
+            if room:
+                self._rooms[id] = room
+                self._start()
+
+            return room
+
+    def checkpoint(self, room: BattleRoom) -> None:
+        with room.lock:
+            version = room.version
+
+            battle: t.Optional[Battle] = Battle.query.get(room.id)
+            if not battle:
+                self.discard(room.id)
+                return
+
+            battle.stage = room.stage
+            battle.started_on = room.started_on
+            battle.truthtable = room.truthtable
+
+            for player in Player.query.filter_by(battle_id=room.id).all():
+                state = room.players.get(player.user_id)
+                if state:
+                    state.apply(player)
+
+            db.session.commit()
+            room.checkpointed = version
+
+    def checkpoint_all(self) -> None:
+        if not self._app:
+            return
+
+        with self._app.app_context():
+            with self._lock:
+                rooms = list(self._rooms.values())
+
+            for room in rooms:
+                if room.dirty:
+                    try:
+                        self.checkpoint(room)
+                    except SQLAlchemyError as e:
+                        # The room stays dirty and is retried with the next checkpoint.
+                        db.session.rollback()
+                        print(f"Database error: {e}")
+                        continue
+
+                with room.lock:
+                    if not room.dirty and time.time() - room.touched_on > self._timeout:
+                        self.discard(room.id)
+
+    def broadcast(self, room: BattleRoom, type: str, data: dict) -> None:
+        """Sends a change to everyone in the battle, clients that miss a sequence number ask for a snapshot."""
+        with room.lock:
+            room.sequence += 1
+            socketio.emit("battle_delta", {"sequence": room.sequence, "type": type, "data": data}, to=room.id)
+
+    def discard(self, id: str) -> None:
+        with self._lock:
+            self._rooms.pop(id, None)
+
+    def join(self, room: BattleRoom, user: User) -> bool:
+        """Adds the user to the battle, returns False when a public battle has no seat left for them."""
+        with room.lock:
+            if user.id in room.players:
+                return True
+
+            if not room.private:
+                if len(room.players) >= MATCHMAKING_BATTLE_SIZE:
+                    return False
+
+                # Players sent here by the matchmaker already have their seat.
+                if not matchmaker.arrived(room.id, user.id) and not matchmaker.joined(room.id, user.id, get_rating(user.id)):
+                    return False
+
+            db.session.add(Player(battle_id=room.id, user_id=user.id))
+            db.session.commit()
+
+            player = room.players[user.id] = PlayerState(user.id, user.username)
+            room.touch()
+            self.broadcast(room, "player_joined", room.serialize_player(player))
+
+            if not room.private and MATCHMAKING_AUTO_START and room.stage == "queue" and len(room.players) >= MATCHMAKING_BATTLE_SIZE:
+                self.start(room, TableGenerator(room.inputs, room.outputs, None).table)
+
+            return True
+
+    def leave(self, room: BattleRoom, user_id: str) -> None:
+        with room.lock:
+            Player.query.filter_by(battle_id=room.id, user_id=user_id).delete()
+            db.session.commit()
+
+            room.players.pop(user_id, None)
+            room.touch()
+            self.broadcast(room, "player_left", {"id": user_id})
+
+            matchmaker.left(room.id, user_id)
+
+    def disband(self, room: BattleRoom) -> None:
+        with room.lock:
+            battle: t.Optional[Battle] = Battle.query.get(room.id)
+            if battle:
+                db.session.delete(battle)
+                db.session.commit()
+
+            matchmaker.close(room.id)
+            self.discard(room.id)
+
+    def start(self, room: BattleRoom, table: dict) -> None:
+        with room.lock:
+            room.truthtable = json.dumps(table)
+            room.table = table
+            room.stage = "battle"
+            room.started_on = time.time() + 3
+            room.touch()
+            self.checkpoint(room)
+
+            matchmaker.close(room.id)
+            self.broadcast(room, "stage_changed", {"stage": room.stage, "started_on": room.started_on, "truthtable": table})
+
+    def restart(self, room: BattleRoom) -> None:
+        with room.lock:
+            for player in room.players.values():
+                player.gates = 0
+                player.attempts = 0
+                player.submission_on = 0
+                player.passed = False
+                player.score = 0
+
+            room.stage = "queue"
+            room.touch()
+            self.checkpoint(room)
+            self.broadcast(room, "stage_changed", {"stage": room.stage})
+
+            if not room.private:
+                ratings = BattleStatistic.get_ratings(room.players)
+                matchmaker.open(room.id, get_configuration(room.inputs, room.outputs, room.gates), {user_id: ratings.get(user_id) for user_id in room.players})
+
+    def finish(self, room: BattleRoom) -> None:
+        """Scores the players, saves their statistics and moves the battle to its results."""
+        with room.lock:
+            winner = room.score_players()
+            if winner:
+                usernames = User.get_usernames(room.players)
+
+                db.session.bulk_save_objects([
+                    BattleStatistic(
+                        room.battle_type,
+                        player.user_id,
+                        player is winner,
+                        player.passed,
+                        player.gates,
+                        player.longest_path,
+                        player.attempts,
+                        player.submission_on - room.started_on,
+                        player.score
+                    )
+                    for player in room.players.values()
+                    if player.user_id in usernames
+                ])
+
+            room.stage = "results"
+            room.touch()
+            self.checkpoint(room)
+            self.broadcast(room, "scores_set", {"scores": {player.user_id: player.score for player in room.players.values()}})
+            self.broadcast(room, "stage_changed", {"stage": room.stage})
+
+    def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+        self.checkpoint_all()
+
+
+battle_rooms = BattleRooms(BATTLE_CHECKPOINT_INTERVAL, BATTLE_ROOM_TIMEOUT)
+atexit.register(battle_rooms.close)
@@ -1,12 +1,13 @@
+from bit_battles.battles.matchmaking import matchmaker, get_configuration, get_rating
 from bit_battles.battles.models import Battle, Player, BattleStatistic
+from bit_battles.battles.rooms import battle_rooms
+from bit_battles.utils.decorators import battle_routed
 from bit_battles.utils.forms import validate_int
 from bit_battles.extensions import db
 
 from flask_login import login_required, current_user
 from flask import Blueprint, render_template, redirect, request, make_response, flash
 
-import typing as t
-
 
 battle_blueprint = Blueprint("battles", __name__, url_prefix="/app")
 
@@ -23,7 +24,7 @@ def battles():
                 BattleStatistic.score.desc() # type: ignore
             ).limit(3).all()
 
-        winners = sorted([winner.leaderboard_serialize() for winner in winners], key=lambda x: x["score"], reverse=True)
+        winners = sorted(BattleStatistic.leaderboard_serialize_all(winners), key=lambda x: x["score"], reverse=True)
 
         return render_template("battles/battles.html", winners=winners, battles=Battle.query.filter_by(private=False, stage="queue").count())
     
@@ -31,18 +32,12 @@ def battles():
     if player:
         return redirect(f"/app/battle/{player.battle_id}")
 
-    battle_id = request.form["battle_id"]
-    battle: t.Optional[Battle] = Battle.query.filter_by(id=battle_id, stage="queue").first()
-
+    battle = Battle.query.filter_by(id=request.form["battle_id"], stage="queue").first()
     if not battle:
         return redirect("/app/battles")
     
-    battle.players.append(current_user)
-    db.session.commit()
-
-    response = make_response(redirect(f"/app/battle/{battle.id}"))
-    response.set_cookie("bt", current_user.set_battle_token())
-    return response
+    # Joined by the battle page, which is routed to the worker that owns the battle.
+    return redirect(f"/app/battle/{battle.id}")
 
 
 @battle_blueprint.route("/battle/new/", methods=["GET", "POST"])
@@ -73,6 +68,9 @@ def new_battle():
     battle.players.append(current_user)
     db.session.add(battle)
     db.session.commit()
+
+    if not private:
+        matchmaker.open(battle.id, get_configuration(inputs, outputs, gates), {current_user.id: get_rating(current_user.id)})
     
     response = make_response(redirect(f"/app/battle/{battle.id}"))
     response.set_cookie("bt", current_user.set_battle_token())
@@ -86,33 +84,38 @@ def random_battle():
     if player:
         return redirect(f"/app/battle/{player.battle_id}")
 
-    battle = Battle.query.filter_by(stage="queue", private=False).first()
-    if not battle:
-        return redirect("/app/battles")
+    configuration = None
+    if request.args.get("inputs") and request.args.get("outputs"):
+        gates = ["AND", "NOT", "OR"]
+        if request.args.get("XOR", "off") == "on":
+            gates.append("XOR")
 
-    battle.players.append(current_user)
-    db.session.commit()
+        configuration = get_configuration(request.args.get("inputs", 0, int), request.args.get("outputs", 0, int), gates)
 
-    response = make_response(redirect(f"/app/battle/{battle.id}"))
-    response.set_cookie("bt", current_user.set_battle_token())
-    return response
+    matchmaker.refresh()
+
+    battle_id = matchmaker.claim(configuration, current_user.id, get_rating(current_user.id))
+    if not battle_id:
+        return redirect("/app/battles")
+
+    return redirect(f"/app/battle/{battle_id}")
 
 
 @battle_blueprint.get("/battle/<string:id>")
+@battle_routed
 @login_required
 def battle(id):
-    battle: t.Optional[Battle] = Battle.query.get(id)
-    if not battle:
+    room = battle_rooms.get(id)
+    if not room:
         return redirect("/app/battles")
     
-    if battle.stage != "queue":
+    if room.stage != "queue":
         return redirect("/app/battles")
 
-    player = Player.query.filter_by(battle_id=id, user_id=current_user.id).first()
-    if not player:
-        db.session.commit()
-        battle.players.append(current_user)
+    if not battle_rooms.join(room, current_user):
+        flash("This battle is full.", "error")
+        return redirect("/app/battles")
     
-    response = make_response(render_template(f"battles/battle.html", battle=battle.serialize(), player=current_user.serialize()))
+    response = make_response(render_template(f"battles/battle.html", battle=room.serialize(), player=current_user.serialize()))
     response.set_cookie("bt", current_user.set_battle_token())
     return response
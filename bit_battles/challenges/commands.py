@@ -0,0 +1,20 @@
+from bit_battles.challenges.models import DailyStreak, Challenge
+
+from flask.cli import AppGroup
+
+import click
+
+
+challenges_cli = AppGroup("challenges", help="Maintenance of the challenges and dailies.")
+
+
+@challenges_cli.command("backfill-streaks")
+def backfill_streaks() -> None:
+    users = DailyStreak.backfill()
+    click.echo(f"Rebuilt the daily streaks of {users} users.")
+
+
+@challenges_cli.command("recount-finished")
+def recount_finished() -> None:
+    Challenge.recount_finished()
+    click.echo("Recounted how many users finished each challenge.")
@@ -4,98 +4,166 @@ from bit_battles.config import PATH_WEIGHT, GATE_WEIGHT
 
 
 from sqlalchemy import func
+from contextlib import contextmanager
 from datetime import date
 
+import typing as t
+import bisect
+import time
 
-def get_daily_leaderboard(date: date) -> list:
-    cache_key = f"daily:{date.strftime('%Y-%m-%d')}"
-    data = cache.get(cache_key)
-    if data:
-        return data
 
-    filtered_stats = db.session.query(DailyChallengeStatistic).filter(
-        DailyChallengeStatistic.date == date,
-        DailyChallengeStatistic.passed == True
+LEADERBOARD_SIZE = 10
+LEADERBOARD_TIMEOUT = 14400
+# Longest a leaderboard stays locked, in case the process dies while updating it.
+LEADERBOARD_LOCK_TIMEOUT = 10
+LEADERBOARD_LOCK_WAIT = 2
+
+Statistic = t.Union[DailyChallengeStatistic, ChallengeStatistic]
+
+
+def _rank(statistic: Statistic, metrics: tuple) -> tuple:
+    shortest_path, least_gates, longest_duration = metrics
+    score = round(
+        (shortest_path * PATH_WEIGHT / max(statistic.longest_path, 1))
+        + (least_gates * GATE_WEIGHT / max(statistic.gates, 1))
+        + (longest_duration / max(statistic.duration, 1))
     )
 
+    return (-score, statistic.duration, -statistic.started_on)
+
+
+def _build_leaderboard(cache_key: str, model: t.Type[Statistic], *criterion: t.Any) -> dict:
+    """
+    Ranks every passed statistic and caches the top ones together with the
+    aggregates their scores are normalised by, so later passes can be
+    ranked without going through everyone again.
+    """
+    filtered_stats = db.session.query(model).filter(*criterion, model.passed == True)
+
     metrics = (
         filtered_stats.with_entities(
-            func.min(DailyChallengeStatistic.longest_path),
-            func.min(DailyChallengeStatistic.gates),
-            func.max(DailyChallengeStatistic.duration)
+            func.min(model.longest_path),
+            func.min(model.gates),
+            func.max(model.duration)
         ).first()
     )
 
-    if not metrics:
-        return []
+    leaderboard = {"metrics": None, "ids": [], "ranks": [], "data": []}
 
-    shortest_path, least_gates, longest_duration = metrics
+    if metrics and metrics[0] is not None:
+        metrics = tuple(metrics)
+        top_users = sorted(
+            ((_rank(user, metrics), user) for user in filtered_stats.all()),
+            key=lambda x: x[0]
+        )[:LEADERBOARD_SIZE]
 
-    users = filtered_stats.all()
-    users_with_scores = [
-        {
-            "user": user,
-            "score": round(
-                (shortest_path * PATH_WEIGHT / max(user.longest_path, 1))
-                + (least_gates * GATE_WEIGHT / max(user.gates, 1))
-                + (longest_duration / max(user.duration, 1))
-            ),
+        leaderboard = {
+            "metrics": metrics,
+            "ids": [user.id for _, user in top_users],
+            "ranks": [rank for rank, _ in top_users],
+            "data": model.leaderboard_serialize_all([user for _, user in top_users]),
         }
-        for user in users
-    ]
 
-    top_users = sorted(
-        users_with_scores,
-        key=lambda x: (-x['score'], x['user'].duration, -x['user'].started_on)
-    )[:10]
-    data = [user['user'].leaderboard_serialize() for user in top_users]
+    cache.set(cache_key, leaderboard, LEADERBOARD_TIMEOUT)
+    return leaderboard
 
-    cache.set(cache_key, data, 14400)
-    return data
 
+@contextmanager
+def _leaderboard_lock(cache_key: str) -> t.Iterator[bool]:
+    """
+    Lets one caller at a time build or update a leaderboard. The cache is
+    shared between workers, so the lock is a cache key. Yields whether the
+    lock was taken within LEADERBOARD_LOCK_WAIT seconds.
+    """
+    lock_key = f"{cache_key}:lock"
+    deadline = time.time() + LEADERBOARD_LOCK_WAIT
 
-def get_challenge_leaderboard(challenge_id: str) -> list:
-    cache_key = f"challenge:{challenge_id}"
-    data = cache.get(cache_key)
-    if data:
-        return data
+    while not cache.add(lock_key, True, LEADERBOARD_LOCK_TIMEOUT):
+        if time.time() > deadline:
+            yield False
+            return
 
-    filtered_stats = db.session.query(ChallengeStatistic).filter(
-        ChallengeStatistic.challenge_id == challenge_id,
-        ChallengeStatistic.passed == True
-    )
+        time.sleep(0.01)
 
-    metrics = (
-        filtered_stats.with_entities(
-            func.min(ChallengeStatistic.longest_path),
-            func.min(ChallengeStatistic.gates),
-            func.max(ChallengeStatistic.duration)
-        ).first()
-    )
+    try:
+        yield True
+    finally:
+        cache.delete(lock_key)
 
-    if not metrics:
-        return []
 
-    shortest_path, least_gates, longest_duration = metrics
+def _get_leaderboard(cache_key: str, model: t.Type[Statistic], *criterion: t.Any) -> dict:
+    leaderboard = cache.get(cache_key)
+    if leaderboard:
+        return leaderboard
 
-    users = filtered_stats.all()
-    users_with_scores = [
-        {
-            "user": user,
-            "score": round(
-                (shortest_path * PATH_WEIGHT / max(user.longest_path, 1))
-                + (least_gates * GATE_WEIGHT / max(user.gates, 1))
-                + (longest_duration / max(user.duration, 1))
-            ),
-        }
-        for user in users
-    ]
+    with _leaderboard_lock(cache_key) as locked:
+        # Whoever held the lock may have built it in the meantime.
+        leaderboard = cache.get(cache_key) if locked else None
+        return leaderboard or _build_leaderboard(cache_key, model, *criterion)
+
+
+def _record_pass(cache_key: str, statistic: Statistic, *criterion: t.Any) -> None:
+    missed_key = f"{cache_key}:missed"
+
+    with _leaderboard_lock(cache_key) as locked:
+        # A pass that waited too long can't be added without risking the holder's write, the
+        # next read rebuilds the leaderboard instead. The holder drops its write when it sees this.
+        if not locked:
+            cache.set(missed_key, True, LEADERBOARD_LOCK_TIMEOUT)
+            cache.delete(cache_key)
+            return
+
+        cache.delete(missed_key)
+        _update_leaderboard(cache_key, statistic, *criterion)
+
+        if cache.get(missed_key):
+            cache.delete(cache_key)
+
+
+def _update_leaderboard(cache_key: str, statistic: Statistic, *criterion: t.Any) -> None:
+    # The leaderboard may have been built after the pass was committed and already count it.
+    leaderboard = cache.get(cache_key)
+    if not leaderboard or statistic.id in leaderboard["ids"]:
+        return
+
+    # A new best or longest duration changes everyone's score.
+    metrics = leaderboard["metrics"]
+    if not metrics or statistic.longest_path < metrics[0] or statistic.gates < metrics[1] or statistic.duration > metrics[2]:
+        _build_leaderboard(cache_key, type(statistic), *criterion)
+        return
+
+    # Equal ranks keep the order they were passed in, like the full sort does.
+    rank = _rank(statistic, metrics)
+    index = bisect.bisect_right(leaderboard["ranks"], rank)
+    if index >= LEADERBOARD_SIZE:
+        return
+
+    for key, value in (("ids", statistic.id), ("ranks", rank), ("data", statistic.leaderboard_serialize())):
+        leaderboard[key].insert(index, value)
+        del leaderboard[key][LEADERBOARD_SIZE:]
+
+    cache.set(cache_key, leaderboard, LEADERBOARD_TIMEOUT)
+
+
+def get_daily_leaderboard(date: date) -> list:
+    cache_key = f"daily:{date.strftime('%Y-%m-%d')}"
+    leaderboard = _get_leaderboard(cache_key, DailyChallengeStatistic, DailyChallengeStatistic.date == date)
+
+    return leaderboard["data"]
+
+
+def record_daily_pass(statistic: DailyChallengeStatistic) -> None:
+    """Moves a newly passed statistic into the cached leaderboard, call it once the pass is committed."""
+    _record_pass(f"daily:{statistic.date.strftime('%Y-%m-%d')}", statistic, DailyChallengeStatistic.date == statistic.date)
+
+
+def get_challenge_leaderboard(challenge_id: str) -> list:
+    cache_key = f"challenge:{challenge_id}"
+    leaderboard = _get_leaderboard(cache_key, ChallengeStatistic, ChallengeStatistic.challenge_id == challenge_id)
+
+    return leaderboard["data"]
 
-    top_users = sorted(
-        users_with_scores,
-        key=lambda x: (-x['score'], x['user'].duration, -x['user'].started_on)
-    )[:10]
-    data = [user['user'].leaderboard_serialize() for user in top_users]
 
-    cache.set(cache_key, data, 14400)
-    return data
+def record_challenge_pass(statistic: ChallengeStatistic) -> None:
+    """Moves a newly passed statistic into the cached leaderboard, call it once the pass is committed."""
+    _record_pass(f"challenge:{statistic.challenge_id}", statistic, ChallengeStatistic.challenge_id == statistic.challenge_id)
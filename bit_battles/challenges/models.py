@@ -3,9 +3,12 @@ from bit_battles.utils.battle import TableGenerator
 from bit_battles.auth.models import User
 from bit_battles.extensions import db
 
+from flask_sqlalchemy.pagination import Pagination
 from flask_login import current_user 
 from datetime import datetime, timezone, timedelta
+from itertools import groupby
 
+import typing as t
 import string
 import json
 import time
@@ -43,6 +46,10 @@ class DailyChallenge(db.Model):
 
 class DailyChallengeStatistic(db.Model):
     __tablename__ = "daily_challenge_statistics"
+    __table_args__ = (
+        db.Index("ix_daily_challenge_statistics_date_passed", "date", "passed"),
+        db.Index("ix_daily_challenge_statistics_user_id_date_passed", "user_id", "date", "passed"),
+    )
 
     id = db.Column(db.String(128), primary_key=True, default=SnowflakeGenerator.generate_id)
     user_id = db.Column(db.String(128), db.ForeignKey("users.id", ondelete="CASCADE"))
@@ -76,40 +83,43 @@ class DailyChallengeStatistic(db.Model):
 
         return challenge_statistic
     
+    @classmethod
+    def get_streaks(cls, user_ids: t.Iterable[str]) -> dict[str, int]:
+        """Current streaks of all given users, read from their materialised streaks in one query."""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return {}
+
+        streaks = {
+            streak.user_id: streak.streak
+            for streak in DailyStreak.query.filter(DailyStreak.user_id.in_(user_ids)).all() # type: ignore
+        }
+
+        return {user_id: streaks.get(user_id, 0) for user_id in user_ids}
+
     @classmethod
     def get_streak(cls, user_id: str) -> int:
-        today = datetime.now(timezone.utc).date()
-        
-        challenges = (
-            DailyChallengeStatistic.query
-            .filter(
-                DailyChallengeStatistic.user_id == user_id, # type: ignore
-                DailyChallengeStatistic.passed == True,
-                DailyChallengeStatistic.date <= today
-            )
-            .order_by(DailyChallengeStatistic.date.desc())
-            .all()
-        )
+        return cls.get_streaks([user_id])[user_id]
 
-        streak = 0
-        for challenge in challenges:
-            if challenge.date != today - timedelta(days=(streak + 1)) and challenge.date != today - timedelta(days=streak):
-                break
-            streak += 1
+    @classmethod
+    def leaderboard_serialize_all(cls, statistics: list['DailyChallengeStatistic']) -> list[dict]:
+        """Leaderboard entries of all statistics, with usernames and streaks fetched in two queries."""
+        usernames = User.get_usernames(statistic.user_id for statistic in statistics)
+        streaks = cls.get_streaks(usernames)
 
-        return streak
+        return [
+            statistic._leaderboard_serialize(usernames[statistic.user_id], streaks[statistic.user_id]) if statistic.user_id in usernames else {}
+            for statistic in statistics
+        ]
 
     def leaderboard_serialize(self) -> dict:
-        user = User.query.with_entities(
-            User.username # type: ignore
-        ).filter_by(id=self.user_id).first()
-        if not user:
-            return {}
+        return self.leaderboard_serialize_all([self])[0]
 
+    def _leaderboard_serialize(self, username: str, streak: int) -> dict:
         return {
             "user_id": self.user_id,
-            "username": user.username,
-            "streak": self.get_streak(self.user_id),
+            "username": username,
+            "streak": streak,
             "gates": self.gates,
             "longest_path": self.longest_path,
             "duration": f"{round(self.duration // 60)}m {round(self.duration % 60)}s",
@@ -129,8 +139,116 @@ class DailyChallengeStatistic(db.Model):
         }
 
 
+class DailyStreak(db.Model):
+    __tablename__ = "daily_streaks"
+
+    user_id = db.Column(db.String(128), db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    # Consecutive days up to the last passed daily, and the same allowing one skipped day.
+    current = db.Column(db.Integer(), default=0)
+    bridged = db.Column(db.Integer(), default=0)
+    longest = db.Column(db.Integer(), default=0)
+    last_passed = db.Column(db.Date(), nullable=True, default=None)
+
+    def __init__(self, user_id: str) -> None:
+        self.user_id = user_id
+        self.current = 0
+        self.bridged = 0
+        self.longest = 0
+
+    @property
+    def streak(self) -> int:
+        """
+        A streak counts back from today and may skip one day, the day
+        skipped can also be today while yesterday's daily is passed.
+        """
+        today = datetime.now(timezone.utc).date()
+
+        if self.last_passed == today:
+            return self.bridged
+
+        if self.last_passed == today - timedelta(days=1):
+            return self.current
+
+        return 0
+
+    def _add(self, date) -> None:
+        if self.last_passed == date:
+            return
+
+        gap = (date - self.last_passed).days if self.last_passed else 0
+        if gap == 1:
+            self.current, self.bridged = self.current + 1, self.bridged + 1
+        elif gap == 2:
+            self.current, self.bridged = 1, self.current + 1
+        else:
+            self.current, self.bridged = 1, 1
+
+        self.last_passed = date
+        self.longest = max(self.longest, self.bridged)
+
+    def _rebuild(self, dates: t.Iterable) -> None:
+        self.current, self.bridged, self.longest, self.last_passed = 0, 0, 0, None
+
+        for date in dates:
+            self._add(date)
+
+    @classmethod
+    def record_pass(cls, user_id: str, date) -> 'DailyStreak':
+        """Counts a passed daily in the user's streak, the caller commits it together with the pass."""
+        streak: t.Optional[DailyStreak] = DailyStreak.query.get(user_id)
+        if not streak:
+            streak = DailyStreak(user_id)
+            db.session.add(streak)
+
+        if not streak.last_passed or date > streak.last_passed:
+            streak._add(date)
+            return streak
+
+        # An older daily can join two streaks, only then the user's history is read again.
+        if date < streak.last_passed:
+            streak._rebuild(
+                date for date, in db.session.query(DailyChallengeStatistic.date)
+                .filter(
+                    DailyChallengeStatistic.user_id == user_id,
+                    DailyChallengeStatistic.passed == True,
+                    DailyChallengeStatistic.date <= datetime.now(timezone.utc).date()
+                )
+                .order_by(DailyChallengeStatistic.date)
+            )
+
+        return streak
+
+    @classmethod
+    def backfill(cls) -> int:
+        """Rebuilds every streak from the passed statistics, returns the number of users with one."""
+        statistics = (
+            db.session.query(DailyChallengeStatistic.user_id, DailyChallengeStatistic.date)
+            .filter(DailyChallengeStatistic.passed == True, DailyChallengeStatistic.date <= datetime.now(timezone.utc).date())
+            .order_by(DailyChallengeStatistic.user_id, DailyChallengeStatistic.date)
+            .yield_per(1000)
+        )
+
+        DailyStreak.query.delete()
+
+        users = 0
+        for user_id, dates in groupby(statistics, key=lambda statistic: statistic[0]):
+            streak = DailyStreak(user_id)
+            streak._rebuild(date for _, date in dates)
+            db.session.add(streak)
+            users += 1
+
+        db.session.commit()
+        return users
+
+
 class Challenge(db.Model):
     __tablename__ = "challenges"
+    __table_args__ = (
+        db.Index("ix_challenges_official_rating", "official", "rating", "creation_timestamp"),
+        db.Index("ix_challenges_official_creation_timestamp", "official", "creation_timestamp"),
+        db.Index("ix_challenges_official_users_finished", "official", "users_finished", "creation_timestamp"),
+        db.Index("ix_challenges_user_id", "user_id"),
+    )
 
     id = db.Column(db.String(128), primary_key=True, default=SnowflakeGenerator.generate_id)
     user_id = db.Column(db.String(128), db.ForeignKey("users.id", ondelete="CASCADE"))
@@ -140,6 +258,7 @@ class Challenge(db.Model):
     
     difficulty = db.Column(db.Integer(), default=0)
     ratings = db.Column(db.Integer(), default=0)
+    users_finished = db.Column(db.Integer(), default=0, server_default="0", nullable=False)
 
     and_gates = db.Column(db.Integer(), default=None, nullable=True)
     or_gates = db.Column(db.Integer(), default=None, nullable=True)
@@ -178,7 +297,7 @@ class Challenge(db.Model):
             "rating": self.rating,
             "description": self.description,
             "official": self.official,
-            "users_finished": ChallengeStatistic.query.filter_by(challenge_id=self.id, passed=True).count(),
+            "users_finished": self.users_finished,
             "completed": ChallengeStatistic.query.filter_by(challenge_id=self.id, user_id=current_user.id, passed=True).first() is not None,
             "editing": False
         }
@@ -206,7 +325,37 @@ class Challenge(db.Model):
             "editing": True
         }
     
-    def list_serialize(self, editing: bool) -> dict:
+    @classmethod
+    def catalogue(cls, official: bool, sort: str, page: int, per_page: int) -> Pagination:
+        """One page of the official or community challenges, ordered by one of CATALOGUE_SORTS."""
+        order = CATALOGUE_SORTS.get(sort, CATALOGUE_SORTS["rating"])
+
+        return (
+            Challenge.query
+            .filter_by(official=official)
+            .order_by(*order, Challenge.id.desc()) # type: ignore
+            .paginate(page=page, per_page=per_page, error_out=False)
+        )
+
+    @classmethod
+    def recount_finished(cls) -> None:
+        """Counts users_finished again from the statistics, in case it drifted from them."""
+        finished = (
+            db.session.query(db.func.count(ChallengeStatistic.id)) # type: ignore
+            .filter(ChallengeStatistic.challenge_id == Challenge.id, ChallengeStatistic.passed == True)
+            .scalar_subquery()
+        )
+
+        Challenge.query.update({Challenge.users_finished: finished}, synchronize_session=False)
+        db.session.commit()
+
+    @classmethod
+    def list_serialize_all(cls, challenges: list['Challenge'], user_id: str) -> list[dict]:
+        """Listing entries of all challenges, with which ones the user completed fetched in one query."""
+        completed = ChallengeStatistic.get_completed(user_id, [challenge.id for challenge in challenges])
+        return [challenge.list_serialize(False, challenge.id in completed) for challenge in challenges]
+
+    def list_serialize(self, editing: bool, completed: t.Optional[bool]=None) -> dict:
         data = {
             "id": self.id,
             "name": self.name,
@@ -215,15 +364,29 @@ class Challenge(db.Model):
         }
 
         if not editing:
+            if completed is None:
+                completed = ChallengeStatistic.query.filter_by(challenge_id=self.id, user_id=current_user.id, passed=True).first() is not None
+
             data["official"] = self.official
-            data["users_finished"] = ChallengeStatistic.query.filter_by(challenge_id=self.id, passed=True).count()
-            data["completed"] = ChallengeStatistic.query.filter_by(challenge_id=self.id, user_id=current_user.id, passed=True).first() is not None
+            data["users_finished"] = self.users_finished
+            data["completed"] = completed
 
         return data
 
 
+CATALOGUE_SORTS = {
+    "rating": (Challenge.rating.desc(), Challenge.creation_timestamp.desc()), # type: ignore
+    "newest": (Challenge.creation_timestamp.desc(),), # type: ignore
+    "finished": (Challenge.users_finished.desc(), Challenge.creation_timestamp.desc()), # type: ignore
+}
+
+
 class ChallengeStatistic(db.Model):
     __tablename__ = "challenge_statistics"
+    __table_args__ = (
+        db.Index("ix_challenge_statistics_challenge_id_user_id_passed", "challenge_id", "user_id", "passed"),
+        db.Index("ix_challenge_statistics_user_id_passed", "user_id", "passed"),
+    )
 
     id = db.Column(db.String(128), primary_key=True, default=SnowflakeGenerator.generate_id)
     user_id = db.Column(db.String(128), db.ForeignKey("users.id", ondelete="CASCADE"))
@@ -260,6 +423,21 @@ class ChallengeStatistic(db.Model):
 
         return challenge_statistic
 
+    @classmethod
+    def get_completed(cls, user_id: str, challenge_ids: list[str]) -> set[str]:
+        """Which of the challenges the user passed, in one query."""
+        if not challenge_ids:
+            return set()
+
+        return {
+            challenge_id for challenge_id, in db.session.query(ChallengeStatistic.challenge_id)
+            .filter(
+                ChallengeStatistic.user_id == user_id, # type: ignore
+                ChallengeStatistic.challenge_id.in_(challenge_ids), # type: ignore
+                ChallengeStatistic.passed == True
+            )
+        }
+
     def serialize(self) -> dict:
         return {
             "user_id": self.user_id,
@@ -271,16 +449,23 @@ class ChallengeStatistic(db.Model):
             "duration": self.duration,
         }
     
+    @classmethod
+    def leaderboard_serialize_all(cls, statistics: list['ChallengeStatistic']) -> list[dict]:
+        """Leaderboard entries of all statistics, with the usernames fetched in one query."""
+        usernames = User.get_usernames(statistic.user_id for statistic in statistics)
+
+        return [
+            statistic._leaderboard_serialize(usernames[statistic.user_id]) if statistic.user_id in usernames else {}
+            for statistic in statistics
+        ]
+
     def leaderboard_serialize(self) -> dict:
-        user = User.query.with_entities(
-            User.username # type: ignore
-        ).filter_by(id=self.user_id).first()
-        if not user:
-            return {}
+        return self.leaderboard_serialize_all([self])[0]
 
+    def _leaderboard_serialize(self, username: str) -> dict:
         return {
             "user_id": self.user_id,
-            "username": user.username,
+            "username": username,
             "gates": self.gates,
             "longest_path": self.longest_path,
             "duration": f"{round(self.duration // 60)}m {round(self.duration % 60)}s",
@@ -1,6 +1,7 @@
 from bit_battles.challenges.functions import get_daily_leaderboard, get_challenge_leaderboard
-from bit_battles.challenges.models import DailyChallenge, DailyChallengeStatistic, Challenge, ChallengeStatistic
+from bit_battles.challenges.models import DailyChallenge, DailyChallengeStatistic, Challenge, ChallengeStatistic, CATALOGUE_SORTS
 from bit_battles.utils.forms import validate_int, validate_bool
+from bit_battles.config import CHALLENGES_PER_PAGE
 from bit_battles.extensions import db
 
 from flask_login import login_required, current_user
@@ -59,8 +60,15 @@ def daily_challenge():
 @challenges_blueprint.get("/challenges")
 @login_required
 def challenges():
-    challenges = [challenge.list_serialize(False) for challenge in Challenge.query.all()]
-    return render_template("challenges/challenges.html", challenges=challenges)
+    official = request.args.get("official", "true") == "true"
+    sort = request.args.get("sort", "rating")
+    if sort not in CATALOGUE_SORTS:
+        sort = "rating"
+
+    pagination = Challenge.catalogue(official, sort, request.args.get("page", 1, int), CHALLENGES_PER_PAGE)
+    challenges = Challenge.list_serialize_all(pagination.items, current_user.id)
+
+    return render_template("challenges/challenges.html", challenges=challenges, pagination=pagination, official=official, sort=sort)
 
 
 @challenges_blueprint.route("/challenge/<string:id>", methods=["GET"])
@@ -0,0 +1,37 @@
+from bit_battles.utils.circuit import circuit_dictionaries, reencode_circuits
+from bit_battles.config import CIRCUITS_DICTIONARY_SAMPLES
+
+from flask.cli import AppGroup
+
+import click
+
+
+circuits_cli = AppGroup("circuits", help="Maintenance of the stored circuits.")
+
+
+@circuits_cli.command("train-dictionary")
+@click.option("--samples", default=CIRCUITS_DICTIONARY_SAMPLES, show_default=True, help="Number of stored circuits to train on.")
+def train_dictionary(samples: int) -> None:
+    id = circuit_dictionaries.train(samples)
+    if id is None:
+        click.echo("There are no stored circuits to train on.")
+        return
+
+    click.echo(f"Trained dictionary {id}. New circuits are compressed with it when CIRCUITS_DICTIONARY=true, after a restart.")
+
+
+@circuits_cli.command("reencode")
+@click.option("--dictionary/--no-dictionary", default=True, show_default=True, help="Compress with the newest dictionary.")
+@click.option("--batch-size", default=500, show_default=True)
+def reencode(dictionary: bool, batch_size: int) -> None:
+    stats = reencode_circuits(circuit_dictionaries.latest() if dictionary else None, batch_size)
+    if not stats["circuits"]:
+        click.echo("There are no stored circuits.")
+        return
+
+    for stage in ("before", "after"):
+        size = stats[f"bytes_{stage}"]
+        throughput = stats["circuits"] / max(stats[f"decode_{stage}"], 1e-9)
+        click.echo(f"{stage:>6}: {size} bytes, {size / stats['circuits']:.1f} bytes per circuit, {throughput:.0f} decodes/s")
+
+    click.echo(f"Rewrote {stats['rewritten']} of {stats['circuits']} circuits.")
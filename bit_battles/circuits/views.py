@@ -15,7 +15,7 @@ circuits_blueprint = Blueprint("circuits", __name__, url_prefix="/app/circuit")
 @circuits_blueprint.get("/daily/<string:id>")
 @login_required
 def daily_circuits(id):
-    success, circuit = Circuit.load("daily", id)
+    success, circuit = Circuit.load_rendered("daily", id)
     if not success:
         return redirect(get_back_url(request))
     
@@ -32,7 +32,7 @@ def daily_circuits(id):
 @circuits_blueprint.get("/challenge/<string:id>")
 @login_required
 def challenge_circuits(id):
-    success, circuit = Circuit.load("challenge", id)
+    success, circuit = Circuit.load_rendered("challenge", id)
     if not success:
         return redirect(get_back_url(request))
     
@@ -49,7 +49,7 @@ def challenge_circuits(id):
 @circuits_blueprint.get("/battle/<string:id>")
 @login_required
 def battle_circuits(id):
-    success, circuit = Circuit.load("battle", id)
+    success, circuit = Circuit.load_rendered("battle", id)
     if not success:
         return redirect(get_back_url(request))
 
@@ -10,4 +10,34 @@ DEBUG = os.getenv("DEBUG") == "true"
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALLOWED_CHARACTERS_REGEX = re.compile(r'^[a-zA-Z0-9_.-]+$')
 PATH_WEIGHT = 3
-GATE_WEIGHT = 1
\ No newline at end of file
+GATE_WEIGHT = 1
+CHALLENGES_PER_PAGE = 25
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", 4096))
+VERDICT_CACHE_TIMEOUT = int(os.getenv("VERDICT_CACHE_TIMEOUT", 3600))
+CIRCUITS_DATABASE = os.getenv("CIRCUITS_DATABASE", "instance/circuits.sqlite3")
+CIRCUITS_POOL_SIZE = int(os.getenv("CIRCUITS_POOL_SIZE", 4))
+CIRCUITS_BATCH_SIZE = int(os.getenv("CIRCUITS_BATCH_SIZE", 64))
+CIRCUITS_FLUSH_INTERVAL = float(os.getenv("CIRCUITS_FLUSH_INTERVAL", 0.5))
+CIRCUITS_DICTIONARY = os.getenv("CIRCUITS_DICTIONARY") == "true"
+CIRCUITS_DICTIONARY_SAMPLES = int(os.getenv("CIRCUITS_DICTIONARY_SAMPLES", 2000))
+CIRCUITS_CACHE_SIZE = int(os.getenv("CIRCUITS_CACHE_SIZE", 32 * 1024 * 1024))
+CIRCUITS_CACHE_RENDERED = os.getenv("CIRCUITS_CACHE_RENDERED", "true") == "true"
+BATTLE_CHECKPOINT_INTERVAL = float(os.getenv("BATTLE_CHECKPOINT_INTERVAL", 10))
+BATTLE_ROOM_TIMEOUT = float(os.getenv("BATTLE_ROOM_TIMEOUT", 900))
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE")
+CACHE_TYPE = os.getenv("CACHE_TYPE", "SimpleCache")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+CACHE_DIR = os.getenv("CACHE_DIR", "instance/cache")
+BATTLE_WORKERS = int(os.getenv("BATTLE_WORKERS", 1))
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", 0))
+SNOWFLAKE_MACHINE_ID = int(os.getenv("SNOWFLAKE_MACHINE_ID", WORKER_INDEX + 1))
+MATCHMAKING_BATTLE_SIZE = int(os.getenv("MATCHMAKING_BATTLE_SIZE", 3))
+MATCHMAKING_RATING_BAND = float(os.getenv("MATCHMAKING_RATING_BAND", 0))
+MATCHMAKING_AUTO_START = os.getenv("MATCHMAKING_AUTO_START", "true") == "true"
+MATCHMAKING_SYNC_INTERVAL = float(os.getenv("MATCHMAKING_SYNC_INTERVAL", 5))
+MATCHMAKING_CLAIM_TIMEOUT = float(os.getenv("MATCHMAKING_CLAIM_TIMEOUT", 30))
+SIMULATION_WORKERS = int(os.getenv("SIMULATION_WORKERS", 2))
+SIMULATION_QUEUE_SIZE = int(os.getenv("SIMULATION_QUEUE_SIZE", 16))
+SIMULATION_CPU_BUDGET = float(os.getenv("SIMULATION_CPU_BUDGET", 2))
+SIMULATION_WAIT = float(os.getenv("SIMULATION_WAIT", 10))
+SIMULATION_RETRY_AFTER = int(os.getenv("SIMULATION_RETRY_AFTER", 2))
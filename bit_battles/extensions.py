@@ -2,7 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO 
 from flask_caching import Cache
 
+from .config import CACHE_TYPE, CACHE_REDIS_URL, CACHE_DIR
+
 
 socketio = SocketIO(cors_allowed_origins="*")
-cache = Cache(config={"CACHE_TYPE" : "SimpleCache", "CACHE_DEFAULT_TIMEOUT": 300})
+cache = Cache(config={"CACHE_TYPE" : CACHE_TYPE, "CACHE_DEFAULT_TIMEOUT": 300, "CACHE_REDIS_URL": CACHE_REDIS_URL, "CACHE_DIR": CACHE_DIR})
 db = SQLAlchemy()
\ No newline at end of file
@@ -154,13 +154,20 @@ async function submit() {
     try {
         const json = await response.json();
         if (!response.ok) return sendAlert(json.error);
-        if (!json.passed) return sendAlert("You did not pass the test.");
+        if (!json.passed) return sendAlert(failedMessage(json.feedback));
         loadStage("results");
     } catch {
         sendAlert("Unexpected error.");
     }
 }
 
+function failedMessage(feedback) {
+    if (!feedback || !feedback.failed_rows.length) return "You did not pass the test.";
+
+    const rows = feedback.failed_rows.map(row => row + 1).join(", ");
+    return `You did not pass the test. Failing rows: ${rows}.`;
+}
+
 let alerts = [];
 
 function sendAlert(message) {
@@ -1,4 +1,6 @@
-const socket = io();
+// The battle id lets the load balancer route the socket to the worker that owns the battle.
+const socket = io({query: {battle: window.location.pathname.split("/").pop()}});
+let resyncing = false;
 
 socket.on("connect", function() {
     console.log("connect");
@@ -9,28 +11,70 @@ socket.on("disconnect", function() {
     console.log("disconnected");
 });
 
-socket.on("player_join", function(data) {
-    if (document.getElementById(data.id)) return;
-    if (document.readyState !== 'loading') return addPlayer(data);
-    document.addEventListener('DOMContentLoaded', function () {
-        addPlayer(data);
-    });
-});
+function whenLoaded(callback) {
+    if (document.readyState !== 'loading') return callback();
+    document.addEventListener('DOMContentLoaded', callback);
+}
 
-socket.on("player_leave", function(data) {
-    document.getElementById(data.id)?.remove();
-});
+function findPlayer(id) {
+    return battle.players.find(_player => _player.id === id);
+}
 
-socket.on("finish", function(data) {
-    sendAlert(`${data.username} finished in ${formatSeconds(data.submission_on - battle.started_on)} with ${data.gates} gate${data.gates === 1? "": "s"} (longest path: ${data.longest_path})`);
-    if (data.username !== player.username) return;
+socket.on("battle_snapshot", function(data) {
+    const stage = battle.stage;
+    resyncing = false;
+    battle = data;
 
-    player.finished = true;
+    whenLoaded(loadPlayers);
+    if (data.stage !== stage) loadStage(data.stage);
 });
 
-socket.on("update_battle", function(data) {
-    battle = data;
-    loadStage(data.stage);
+const deltaHandlers = {
+    player_joined: function(data) {
+        if (!findPlayer(data.id)) battle.players.push(data);
+        whenLoaded(() => {
+            if (!document.getElementById(data.id)) addPlayer(data);
+        });
+    },
+    player_left: function(data) {
+        battle.players = battle.players.filter(_player => _player.id !== data.id);
+        document.getElementById(data.id)?.remove();
+    },
+    player_passed: function(data) {
+        Object.assign(findPlayer(data.id) || {}, data);
+        sendAlert(`${data.username} finished in ${formatSeconds(data.time)} with ${data.gates} gate${data.gates === 1? "": "s"} (longest path: ${data.longest_path})`);
+        if (data.id !== player.id) return;
+
+        player.finished = true;
+    },
+    scores_set: function(data) {
+        for (const _player of battle.players) {
+            _player.score = data.scores[_player.id] ?? _player.score;
+        }
+        battle.players.sort((a, b) => b.score - a.score);
+    },
+    stage_changed: function(data) {
+        Object.assign(battle, data);
+        if (data.stage === "queue") {
+            for (const _player of battle.players) {
+                Object.assign(_player, {gates: 0, attempts: 0, submission_on: 0, passed: false, score: 0});
+            }
+        }
+        loadStage(data.stage);
+    },
+};
+
+socket.on("battle_delta", function(delta) {
+    if (resyncing || delta.sequence <= battle.sequence) return;
+
+    // A delta went missing, the snapshot replaces everything up to now.
+    if (delta.sequence !== battle.sequence + 1) {
+        resyncing = true;
+        return socket.emit("resync", {battle_id: battle.id, player_id: player.id});
+    }
+
+    battle.sequence = delta.sequence;
+    deltaHandlers[delta.type]?.(delta.data);
 });
 
 socket.on("disband", function() {
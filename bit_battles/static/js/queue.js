@@ -10,7 +10,16 @@ if (document.readyState !== 'loading') {
 
 function queueInit() {
     playerListElement = document.getElementById("queue-player-list");
-    
+    loadPlayers();
+}
+
+function loadPlayers() {
+    const ids = battle.players.map(player => player.id);
+
+    for (const element of [...playerListElement.children]) {
+        if (!ids.includes(element.id)) element.remove();
+    }
+
     for (const player of battle.players) {
         if (document.getElementById(player.id)) continue;
 
@@ -1,9 +1,25 @@
+from bit_battles.utils.netlist import Netlist
+from bit_battles.config import BATTLE_WORKERS, WORKER_INDEX
+
 from collections import defaultdict
 
 import typing as t
 
 import string
 import random
+import zlib
+
+
+def battle_worker(battle_id: str) -> int:
+    """
+    Index of the worker a battle is routed to. Matches the worker nginx's
+    `hash $battle` picks from an upstream of BATTLE_WORKERS equal servers.
+    """
+    return ((zlib.crc32(battle_id.encode()) >> 16) & 0x7fff) % BATTLE_WORKERS
+
+
+def owns_battle(battle_id: str) -> bool:
+    return battle_worker(battle_id) == WORKER_INDEX
 
 
 class TableGenerator:
@@ -32,211 +48,127 @@ class TableGenerator:
         return self._table
 
 
+ENGINES = {"bitwise", "compiled", "iterative"}
+
+
 class Simulate:
-    def __init__(self, gates: list[dict], wires: list[dict], gate_limits: dict) -> None:
+    def __init__(self, gates: list[dict], wires: list[dict], gate_limits: dict, engine: str="bitwise") -> None:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown simulation engine '{engine}'.")
+
         self._gates = gates
         self._wires = wires
-        self._wire_lookup = defaultdict(list)
-        self._input_lookup = defaultdict(dict)
-        self._outputs = []
-        self._prepared = False
         self._gate_limits = gate_limits
+        self._engine = engine
+        self._netlist: t.Optional[Netlist] = None
 
-    def _get_input_wires(self, gate: dict) -> list:
-        wires: t.Optional[list[dict]] = []
-
-        for input in gate["inputs"]:
-            if not input["x"] or not input["y"]:
-                continue
-
-            _wires = self._wire_lookup.get(f"{input['x']},{input['y']}")
-
-            if not _wires:
-                continue
-
-            if len(_wires) > 1:
-                raise ValueError("Invalid circuit. Gate inputs cannot have more than one input wire.")
-
-            wire = _wires[0]
-            wires.append(wire)
-
-            if self._prepared:
-                continue
-
-            if input["x"] == wire["startX"] and input["y"] == wire["startY"]:
-                self._input_lookup[f"{wire['startX']},{wire['startY']}"] = gate
-                continue
-
-            self._input_lookup[f"{wire['endX']},{wire['endY']}"] = gate
-
-        return wires
-
-    def _prepare(self) -> None:
-        self._outputs = []
-
-        for wire in self._wires:
-            wire["state"] = "off"
-            wire["visited"] = False
-            wire["path"] = {"input": None, "gates": 0}
-
-            if self._prepared:
-                continue
-
-            self._wire_lookup[f"{wire['startX']},{wire['startY']}"].append(wire)
-            self._wire_lookup[f"{wire['endX']},{wire['endY']}"].append(wire)
-
-        gate_counts = defaultdict(int)
-        for gate in self._gates:
-            gate_counts[gate["type"]] += 1
-            limit = self._gate_limits.get(gate["type"])
-
-            if limit:
-                if gate_counts[gate["type"]] > limit:
-                    raise ValueError(f"Maximum amount of {gate['type']} gates exceeded.")
-
-            gate["inputStates"] = self._get_input_wires(gate)
-            gate["path"] = {"input": None, "gates": 0}
-
-        self._prepared = True
-
-    def _get_output_wire(self, gate: dict) -> t.Optional[dict]:
-        if not gate["output"]["x"] or not gate["output"]["y"]:
-            return None
-
-        wires = self._wire_lookup.get(f"{gate['output']['x']},{gate['output']['y']}")
-        if not wires:
-            return None
-
-        return wires[0]
+    @property
+    def netlist(self) -> Netlist:
+        if not self._netlist:
+            self._netlist = Netlist(self._gates, self._wires, self._gate_limits)
 
-    def _get_input_wire_index(self, gate: dict, wire: dict) -> int:
-        gate["completed"] = 0
-        index = None
+        return self._netlist
 
-        for i in range(len(gate["inputStates"])):
-            _wire = gate["inputStates"][i]
-            if isinstance(_wire, int):
-                gate["completed"] += 1
+    def _get_columns(self, truthtable: dict) -> t.Optional[dict[str, int]]:
+        columns = {}
 
-            if wire == _wire:
-                index = i
+        for key, values in truthtable.items():
+            column = 0
 
-        if index == None:
-            raise ValueError("Invalid gate 1")
+            for i, value in enumerate(values):
+                if value not in (0, 1):
+                    return None
 
-        return index
+                column |= value << i
 
-    def _evaluate(self, gate: dict) -> int:
-        gate_type = gate["type"]
-        inputs: list = gate["inputStates"]
+            columns[key] = column
 
-        if gate_type == "AND":
-            return int(all(inputs))
+        return columns
 
-        if gate_type == "OR":
-            return int(any(inputs))
+    def _test_rows(self, truthtable: dict) -> t.Tuple[bool, int]:
+        netlist = self.netlist
+        evaluate = netlist.propagate if self._engine == "iterative" else netlist.evaluate
 
-        if gate_type == "NOT":
-            return int(not inputs[0])
+        for i in range(len(truthtable["A"])):
+            inputs = {}
+            outputs = {}
 
-        if gate_type == "XOR":
-            return int(inputs.count(1) == 1)
-        
-        if gate_type == "INPUT":
-            raise ValueError("Inputs should not evaluated")      
+            for key, value in truthtable.items():
+                if ord(key) > 77:
+                    outputs[key] = value[i]
+                else:
+                    inputs[key] = value[i]
 
-        if gate_type == "OUTPUT":
-            gate["value"] = inputs[0]
-            return gate["value"]
+            values = evaluate(inputs)
 
-        raise ValueError("Invalid circuit. Gate does not exist")
-    
-    def _update_path(self, path_1, path_2) -> None:
-        if path_1 == path_2:
-            return
-        
-        if path_1["path"]["gates"] > path_2["path"]["gates"]:
-            return
-        
-        path_1["path"]["input"] = path_2["path"]["input"]
-        path_1["path"]["gates"] = path_2["path"]["gates"]
+            for output in netlist.outputs:
+                if values[output] != outputs[netlist.ids[output]]:
+                    return False, 0
 
-    def _evaluate_gate(self, gate: dict, wire: dict, state: int) -> None:
-        self._update_path(gate, wire)
-        input_wire_index = self._get_input_wire_index(gate, wire)
-        gate["inputStates"][input_wire_index] = state
+        return True, netlist.longest_path
 
-        if (gate["completed"] + 1) < len(gate["inputStates"]):
-            return
+    def _test_bitwise(self, truthtable: dict) -> t.Tuple[bool, int]:
+        netlist = self.netlist
+        rows = len(truthtable["A"])
+        columns = self._get_columns(truthtable)
 
-        _state = self._evaluate(gate)
-        output_wire = self._get_output_wire(gate)
-        gate["path"]["gates"] += 1
+        # Tables that can't be packed and outputs without a column fall back to
+        # the row by row comparison, so they fail exactly like they always did.
+        if columns is None:
+            return self._test_rows(truthtable)
 
-        if output_wire:
-            return self._propagate_signal(output_wire, _state, gate)
+        inputs = {key: column for key, column in columns.items() if ord(key) <= 77}
+        outputs = {key: column for key, column in columns.items() if ord(key) > 77}
 
-    def _propagate_signal(self, wire: dict, state: int, path_2: dict) -> None:
-        if wire["visited"]:
-            return
+        if any(netlist.ids[output] not in outputs for output in netlist.outputs):
+            return self._test_rows(truthtable)
 
-        self._update_path(wire, path_2)
-        wire["state"] = "on" if state else "off"
-        wire["visited"] = True
+        values = netlist.evaluate_masks(inputs, rows)
 
-        gate = self._input_lookup.get(f"{wire['startX']},{wire['startY']}")
-        if not gate:
-            gate = self._input_lookup.get(f"{wire['endX']},{wire['endY']}")
+        failed = 0
+        for output in netlist.outputs:
+            failed |= values[output] ^ outputs[netlist.ids[output]]
 
-        if gate:
-            return self._evaluate_gate(gate, wire, state)
+        if failed:
+            return False, 0
 
-        wires = self._wire_lookup.get(f"{wire['startX']},{wire['startY']}", [])
-        wires.extend(self._wire_lookup.get(f"{wire['endX']},{wire['endY']}", []))
+        return True, netlist.longest_path
 
-        for _wire in wires:
-            if _wire["visited"]:
-                continue
+    def diagnose(self, truthtable: dict) -> dict:
+        """
+        Evaluates every row, in one bitwise pass where the table allows it,
+        and reports which rows and outputs failed together with the output
+        columns the circuit computed. Unlike `test` it doesn't stop early.
+        """
+        netlist = self.netlist
+        rows = len(truthtable["A"])
+        columns = self._get_columns(truthtable)
+        outputs = [node for node in netlist.outputs if netlist.ids[node] in truthtable]
+        computed = {netlist.ids[node]: [] for node in outputs}
 
-            self._propagate_signal(_wire, state, wire)
+        if columns is None:
+            for i in range(rows):
+                values = netlist.evaluate({key: value[i] for key, value in truthtable.items() if ord(key) <= 77})
 
-    def simulate(self, initial_states: dict) -> None:
-        self._prepare()
+                for node in outputs:
+                    computed[netlist.ids[node]].append(values[node])
 
-        for gate in self._gates:
-            if gate["type"] == "OUTPUT":
-                self._outputs.append(gate)
-                continue
+        else:
+            values = netlist.evaluate_masks({key: column for key, column in columns.items() if ord(key) <= 77}, rows)
 
-            if gate["type"] != "INPUT":
-                continue
+            for node in outputs:
+                computed[netlist.ids[node]] = [values[node] >> i & 1 for i in range(rows)]
 
-            wire = self._get_output_wire(gate)
-            if not wire:
-                continue
-                #raise ValueError("Invalid circuit. Inputs not connected.")
+        failed_rows = [i for i in range(rows) if any(column[i] != truthtable[key][i] for key, column in computed.items())]
 
-            wire["path"]["gate"] = gate
-            self._propagate_signal(wire, initial_states.get(gate["id"], 1), wire)
+        return {
+            "failed_rows": failed_rows,
+            "failed_outputs": [key for key, column in computed.items() if column != list(truthtable[key])],
+            "outputs": computed,
+        }
 
     def test(self, truthtable: dict) -> t.Tuple[bool, int]:
-        longest_path = 0
-
-        for i in range(len(truthtable["A"])):
-            inputs = {}
-            outputs = {}
-
-            for key, value in truthtable.items():
-                if ord(key) > 77:
-                    outputs[key] = value[i]
-                else:
-                    inputs[key] = value[i]
-
-            self.simulate(inputs)
-
-            for output in self._outputs:
-                longest_path = max(longest_path, output["path"]["gates"] - 1)
-                if output.get("value", 0) != outputs[output["id"]]:
-                    return False, 0
+        if self._engine == "bitwise":
+            return self._test_bitwise(truthtable)
 
-        return True, longest_path
+        return self._test_rows(truthtable)
@@ -1,29 +1,341 @@
+from bit_battles.utils.storage import TABLES, get_db_connection
+from bit_battles.config import CIRCUITS_BATCH_SIZE, CIRCUITS_FLUSH_INTERVAL, CIRCUITS_DICTIONARY, CIRCUITS_CACHE_SIZE, CIRCUITS_CACHE_RENDERED
+from bit_battles.utils.encoding import encode, decode, dictionary_id, train_dictionary
 from bit_battles.utils.snowflakes import SnowflakeGenerator
 
-from contextlib import contextmanager
+from jinja2.utils import htmlsafe_json_dumps
+from collections import OrderedDict
+from markupsafe import Markup
 
 import typing as t
+import threading
 import sqlite3
 import string
+import atexit
 import orjson
-import zlib
+import hashlib
 import time
-import os
+import sys
 
 
-@contextmanager
-def get_db_connection(db_path="instance/circuits.sqlite3"):
-    """Context manager for SQLite connection."""
-    conn = sqlite3.connect(db_path)
-    try:
-        yield conn
-    finally:
-        conn.close()
+# Only these are stored, editor state like pins and signal states is derived again when loading.
+GATE_FIELDS = ("x", "y", "type", "rotation", "id")
+WIRE_FIELDS = ("startX", "startY", "endX", "endY")
+GATES = {"AND", "OR", "NOT", "XOR", "INPUT", "OUTPUT"}
 
+# Built once so every call runs the exact same SQL and the statement cache can reuse it.
+# The same circuit is stored once in circuit_blobs, rows only point at it through its hash.
+INSERT_BLOB_QUERY = "INSERT OR IGNORE INTO circuit_blobs (hash, circuit) VALUES (?, ?)"
+INSERT_QUERIES = {
+    table: f"INSERT INTO {table}_circuits (id, {table}_id, user_id, circuit, circuit_hash, creation_timestamp) VALUES (?, ?, ?, '', ?, ?)"
+    for table in TABLES
+}
+SELECT_QUERIES = {
+    table: f"""
+        SELECT {table}_circuits.{table}_id, COALESCE(circuit_blobs.circuit, {table}_circuits.circuit)
+        FROM {table}_circuits LEFT JOIN circuit_blobs ON circuit_blobs.hash = {table}_circuits.circuit_hash
+        WHERE {table}_circuits.id = ?
+    """
+    for table in TABLES
+}
 
-GATE_FIELDS = {"inputStates", "inputs", "output", "path", "state", "value", "completed"}
-WIRE_FIELDS = {"path", "state", "visited"}
-GATES = {"AND", "OR", "NOT", "XOR", "INPUT", "OUTPUT"}
+# Rows saved before circuits were deduplicated have no hash and keep their own blob.
+SAMPLE_QUERY = "SELECT circuit FROM ({}) ORDER BY RANDOM() LIMIT ?".format(" UNION ALL ".join(
+    ["SELECT circuit FROM circuit_blobs"] + [f"SELECT circuit FROM {table}_circuits WHERE circuit_hash IS NULL" for table in TABLES]
+))
+REENCODE_QUERIES = [
+    ("SELECT hash, circuit FROM circuit_blobs WHERE hash > ? ORDER BY hash LIMIT ?", "UPDATE circuit_blobs SET circuit = ? WHERE hash = ?")
+] + [
+    (f"SELECT id, circuit FROM {table}_circuits WHERE circuit_hash IS NULL AND id > ? ORDER BY id LIMIT ?", f"UPDATE {table}_circuits SET circuit = ? WHERE id = ?")
+    for table in TABLES
+]
+
+
+class CircuitDictionaries:
+    """
+    Preset dictionaries circuits are compressed with. Every blob names the
+    dictionary it needs, so dictionaries are only ever added, never changed
+    or removed. Which one is the newest is looked up once per process.
+    """
+
+    def __init__(self) -> None:
+        self._dictionaries: dict[int, bytes] = {}
+        self._latest: t.Optional[tuple[int, bytes]] = None
+        self._latest_loaded = False
+
+    def get(self, id: t.Optional[int]) -> t.Optional[bytes]:
+        if id is None:
+            return None
+
+        if id not in self._dictionaries:
+            with get_db_connection() as conn:
+                row = conn.execute("SELECT dictionary FROM circuit_dictionaries WHERE id = ?", (id,)).fetchone()
+
+            if not row:
+                return None
+
+            self._dictionaries[id] = row[0]
+
+        return self._dictionaries[id]
+
+    def latest(self) -> t.Optional[tuple[int, bytes]]:
+        if not self._latest_loaded:
+            with get_db_connection() as conn:
+                row = conn.execute("SELECT id, dictionary FROM circuit_dictionaries ORDER BY id DESC LIMIT 1").fetchone()
+
+            if row:
+                self._latest = row[0], row[1]
+                self._dictionaries[row[0]] = row[1]
+
+            self._latest_loaded = True
+
+        return self._latest
+
+    def train(self, samples: int) -> t.Optional[int]:
+        """Trains a dictionary on a random sample of the stored circuits and makes it the newest."""
+        with get_db_connection() as conn:
+            blobs = [row[0] for row in conn.execute(SAMPLE_QUERY, (samples,))]
+
+        dictionary = train_dictionary(_decode(blob) for blob in blobs)
+        if not dictionary:
+            return None
+
+        with get_db_connection() as conn:
+            id = conn.execute("INSERT INTO circuit_dictionaries (dictionary) VALUES (?)", (dictionary,)).lastrowid
+            conn.commit()
+
+        self._dictionaries[id] = dictionary
+        self._latest, self._latest_loaded = (id, dictionary), True
+
+        return id
+
+
+circuit_dictionaries = CircuitDictionaries()
+
+
+def _decode(blob: bytes) -> dict:
+    return decode(blob, circuit_dictionaries.get(dictionary_id(blob)))
+
+
+def reencode_circuits(dictionary: t.Optional[tuple[int, bytes]], batch_size: int=500) -> dict[str, t.Any]:
+    """
+    Encodes every stored blob again, with the given dictionary if there is
+    one. Blobs are only rewritten when that makes them smaller. Returns the
+    sizes and the time spent decoding, before and after.
+    """
+    stats = {"circuits": 0, "rewritten": 0, "bytes_before": 0, "bytes_after": 0, "decode_before": 0.0, "decode_after": 0.0}
+
+    for select, update in REENCODE_QUERIES:
+        last = ""
+
+        while True:
+            with get_db_connection() as conn:
+                rows = conn.execute(select, (last, batch_size)).fetchall()
+
+            if not rows:
+                break
+
+            last = rows[-1][0]
+            updates = []
+
+            for key, blob in rows:
+                start = time.perf_counter()
+                circuit = _decode(blob)
+                stats["decode_before"] += time.perf_counter() - start
+                stats["bytes_before"] += len(blob)
+
+                reencoded = encode(circuit, dictionary)
+                if len(reencoded) < len(blob):
+                    updates.append((reencoded, key))
+                    blob = reencoded
+
+                start = time.perf_counter()
+                _decode(blob)
+                stats["decode_after"] += time.perf_counter() - start
+
+                stats["circuits"] += 1
+                stats["bytes_after"] += len(blob)
+
+            stats["rewritten"] += len(updates)
+
+            with get_db_connection() as conn:
+                conn.executemany(update, updates)
+                conn.commit()
+
+    return stats
+
+
+class CircuitWriter:
+    """
+    Write-behind queue for saved circuits. Rows are kept in memory and
+    written in one transaction per batch, when `batch_size` rows are waiting
+    or every `interval` seconds, and once more when the process exits. Rows
+    stay readable through `get` until they are committed.
+    """
+
+    def __init__(self, batch_size: int, interval: float) -> None:
+        self._batch_size = batch_size
+        self._interval = interval
+        self._rows: dict[str, dict[int, tuple]] = {table: {} for table in TABLES}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: t.Optional[threading.Thread] = None
+        self._closed = False
+
+    @property
+    def pending(self) -> int:
+        return sum(len(rows) for rows in self._rows.values())
+
+    def _start(self) -> None:
+        if self._thread or self._closed:
+            return
+
+        self._thread = threading.Thread(target=self._run, name="circuit-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(self._interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def put(self, table: str, row: tuple) -> None:
+        with self._lock:
+            self._rows[table][row[0]] = row
+            self._start()
+            full = self.pending >= self._batch_size
+
+        if full:
+            self._wakeup.set()
+
+    def get(self, table: str, id: int) -> t.Optional[tuple]:
+        with self._lock:
+            return self._rows[table].get(id)
+
+    def _write(self, batches: dict[str, list[tuple]]) -> None:
+        # Rows are (id, table id, user id, circuit hash, timestamp, circuit).
+        blobs = {row[3]: row[5] for rows in batches.values() for row in rows}
+
+        with get_db_connection() as conn:
+            conn.executemany(INSERT_BLOB_QUERY, blobs.items())
+
+            try:
+                for table, rows in batches.items():
+                    conn.executemany(INSERT_QUERIES[table], [row[:5] for row in rows])
+
+                conn.commit()
+                return
+
+            except sqlite3.IntegrityError:
+                conn.rollback()
+                conn.executemany(INSERT_BLOB_QUERY, blobs.items())
+
+            # A row that can never be written shouldn't hold back the rest of its batch.
+            for table, rows in batches.items():
+                for row in rows:
+                    try:
+                        conn.execute(INSERT_QUERIES[table], row[:5])
+                    except sqlite3.IntegrityError as e:
+                        print(f"Dropping circuit {row[0]}: {e}")
+
+            conn.commit()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                batches = {table: list(rows.values()) for table, rows in self._rows.items() if rows}
+
+            if not batches:
+                return
+
+            try:
+                self._write(batches)
+            except sqlite3.Error as e:
+                # Rows stay queued and are retried with the next flush.
+                print(f"Database error: {e}")
+                return
+
+            with self._lock:
+                for table, rows in batches.items():
+                    for row in rows:
+                        self._rows[table].pop(row[0], None)
+
+    def close(self) -> None:
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+
+
+circuit_writer = CircuitWriter(CIRCUITS_BATCH_SIZE, CIRCUITS_FLUSH_INTERVAL)
+atexit.register(circuit_writer.close)
+
+
+class CircuitCache:
+    """
+    Read-through cache of loaded circuits, optionally with the JSON pages
+    embed them as. Saved circuits never change, so entries don't expire,
+    the least recently used go once they take up more than `max_bytes`.
+    Cached circuits are shared, callers must not modify them.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict[tuple[str, str], tuple[dict, t.Optional[Markup], int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _footprint(self, loaded: dict, rendered: t.Optional[Markup]) -> int:
+        circuit = loaded["circuit"]
+        elements = circuit["g"] + circuit["w"]
+        size = sys.getsizeof(circuit["g"]) + sys.getsizeof(circuit["w"]) + sum(map(sys.getsizeof, elements))
+        size += sum(sys.getsizeof(value) for element in elements for value in element.values())
+
+        return size + (sys.getsizeof(rendered) if rendered else 0)
+
+    def get(self, key: tuple[str, str]) -> t.Optional[tuple[dict, t.Optional[Markup]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def set(self, key: tuple[str, str], loaded: dict, rendered: t.Optional[Markup]=None) -> None:
+        size = self._footprint(loaded, rendered)
+        if size > self._max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._bytes -= previous[2]
+
+            self._entries[key] = (loaded, rendered, size)
+            self._bytes += size
+
+            while self._bytes > self._max_bytes:
+                self._bytes -= self._entries.popitem(last=False)[1][2]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+circuit_cache = CircuitCache(CIRCUITS_CACHE_SIZE)
+
+
+def _dumps(obj: t.Any, **kwargs: t.Any) -> str:
+    return orjson.dumps(obj).decode()
 
 
 class Circuit:
@@ -31,38 +343,6 @@ class Circuit:
         self._gates: list[dict] = gates
         self._wires: list[dict] = wires
 
-    def _create_db(self) -> None:
-        query = """
-            CREATE TABLE IF NOT EXISTS battle_circuits(
-                id TEXT PRIMARY KEY,
-                battle_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                circuit TEXT NOT NULL,
-                creation_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-
-            CREATE TABLE IF NOT EXISTS daily_circuits(
-                id TEXT PRIMARY KEY,
-                daily_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                circuit TEXT NOT NULL,
-                creation_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-            
-            CREATE TABLE IF NOT EXISTS challenge_circuits(
-                id TEXT PRIMARY KEY,
-                challenge_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                circuit TEXT NOT NULL,
-                creation_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """
-        
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.executescript(query)
-            conn.commit()
-
     def _valid(self, value: t.Any, key: str) -> bool:
         if key == "id":
             if isinstance(value, int):
@@ -87,12 +367,13 @@ class Circuit:
 
         return False
 
-    def _sanitize_element(self, element: dict, redundant_keys: set, key_truncation: int) -> dict:
+    def _sanitize_element(self, element: dict, fields: tuple[str, ...], key_truncation: int) -> dict:
         sanitized = {}
-        for key, value in element.items():
-            if key in redundant_keys:
+        for key in fields:
+            if key not in element:
                 continue
 
+            value = element[key]
             if not self._valid(value, key):
                 raise ValueError(f"Invalid circuit data. '{value}' is not of type '{key}'.")
             
@@ -104,60 +385,87 @@ class Circuit:
         self._gates = [self._sanitize_element(gate, GATE_FIELDS, 1) for gate in self._gates]
         self._wires = [self._sanitize_element(wire, WIRE_FIELDS, 2) for wire in self._wires]
 
-    def _get_compressed(self) -> bytes:
-        return zlib.compress(orjson.dumps({"g": self._gates, "w": self._wires}))
+    def _get_compressed(self) -> tuple[str, bytes]:
+        circuit = {"g": self._gates, "w": self._wires}
+        dictionary = circuit_dictionaries.latest() if CIRCUITS_DICTIONARY else None
+
+        return hashlib.blake2b(orjson.dumps(circuit), digest_size=16).hexdigest(), encode(circuit, dictionary)
     
     def save(self, table: str, table_id: str, user_id: str) -> tuple[bool, int]:
-        if not os.path.exists("instance/circuits.sqlite3"):
-            self._create_db()
+        """Queues the circuit for writing, the id can be used right away."""
+        if table not in TABLES:
+            return False, 0
 
         self._sanitize()
 
-        query = f"""
-            INSERT INTO {table}_circuits (
-                id, {table}_id, user_id, circuit, creation_timestamp
-            ) VALUES (?, ?, ?, ?, ?)
-        """
-        
         try:
-            with get_db_connection() as conn:
-                id = SnowflakeGenerator().generate_id()
+            id = SnowflakeGenerator().generate_id()
+            circuit_hash, circuit = self._get_compressed()
+            circuit_writer.put(table, (id, table_id, user_id, circuit_hash, time.time(), circuit))
 
-                cursor = conn.cursor()
-                cursor.execute(
-                    query,
-                    (id, table_id, user_id, self._get_compressed(), time.time())
-                )
-                conn.commit()
-                
-                return True, id
-        except sqlite3.Error as e:
-            print(f"Database error: {e}")
-            return False, 0
-        
+            return True, id
         except Exception as e:
             print(f"Unexpected error: {e}")
             return False, 0
-    
+
     @classmethod
     def load(cls, table: str, circuit_id: int) -> tuple[bool, dict]:
-        query = f"""
-            SELECT {table}_id, circuit FROM {table}_circuits WHERE id = ?
-        """
+        query = SELECT_QUERIES.get(table)
+        if not query:
+            return False, {}
+
+        key = (table, str(circuit_id))
+        cached = circuit_cache.get(key)
+        if cached:
+            return True, cached[0]
+
+        success, loaded = cls._load(table, circuit_id, query)
+        if success:
+            circuit_cache.set(key, loaded)
+
+        return success, loaded
+
+    @classmethod
+    def load_rendered(cls, table: str, circuit_id: int) -> tuple[bool, dict]:
+        """Like `load`, with the circuit as JSON ready to embed in a page."""
+        query = SELECT_QUERIES.get(table)
+        if not query:
+            return False, {}
+
+        key = (table, str(circuit_id))
+        cached = circuit_cache.get(key)
+        loaded, rendered = cached or (None, None)
+
+        if not loaded:
+            success, loaded = cls._load(table, circuit_id, query)
+            if not success:
+                return False, {}
+
+        if not rendered:
+            rendered = htmlsafe_json_dumps(loaded["circuit"], dumps=_dumps)
+
+            if not cached or CIRCUITS_CACHE_RENDERED:
+                circuit_cache.set(key, loaded, rendered if CIRCUITS_CACHE_RENDERED else None)
+
+        return True, {f"{table}_id": loaded[f"{table}_id"], "circuit": rendered}
+
+    @classmethod
+    def _load(cls, table: str, circuit_id: int, query: str) -> tuple[bool, dict]:
+        pending = circuit_writer.get(table, int(circuit_id)) if str(circuit_id).isdigit() else None
+        if pending:
+            return True, {f"{table}_id": pending[1], "circuit": _decode(pending[5])}
 
         try:
             with get_db_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute(
+                circuit = conn.execute(
                     query,
                     (circuit_id,)
-                )
-                circuit = cursor.fetchone()
+                ).fetchone()
 
                 if not circuit:
                     return False, {}
                 
-                return True, {f"{table}_id": circuit[0], "circuit": orjson.loads(zlib.decompress(circuit[1]))}
+                return True, {f"{table}_id": circuit[0], "circuit": _decode(circuit[1])}
             
         except sqlite3.Error as e:
             print(f"Database error: {e}")
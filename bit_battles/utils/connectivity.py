@@ -0,0 +1,27 @@
+from bit_battles.utils.elements import Point
+
+
+class ConnectivityIndex:
+    """
+    Which wires meet at every point of a circuit, indexed once up front.
+    Returned lists are shared and must not be modified.
+    """
+
+    def __init__(self, starts: list[Point], ends: list[Point]) -> None:
+        self._wires: dict[Point, list[int]] = {}
+
+        for index, (start, end) in enumerate(zip(starts, ends)):
+            wires = self._wires.get(start)
+            if wires is None:
+                self._wires[start] = [index]
+            else:
+                wires.append(index)
+
+            wires = self._wires.get(end)
+            if wires is None:
+                self._wires[end] = [index]
+            else:
+                wires.append(index)
+
+    def wires_at(self, point: Point) -> list[int]:
+        return self._wires.get(point, [])
@@ -1,3 +1,4 @@
+from bit_battles.utils.battle import owns_battle
 from bit_battles.auth.models import User
 
 from functools import wraps
@@ -44,3 +45,15 @@ def user_authorized(f):
 
         return f(*args, **kwargs)
     return _decorated_function
+
+
+def battle_routed(f):
+    @wraps(f)
+
+    def _decorated_function(id, *args, **kwargs):
+        # Live battles are kept in the memory of one worker, see BattleRooms.
+        if not owns_battle(id):
+            return {"error": "This battle is served by another worker."}, 421
+
+        return f(id, *args, **kwargs)
+    return _decorated_function
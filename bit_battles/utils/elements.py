@@ -0,0 +1,65 @@
+import typing as t
+
+
+Point = t.Union[int, str]
+
+# y is stored in the low bits, within this range every pair of ints gets its own key.
+_Y_BITS = 21
+_Y_LIMIT = 1 << _Y_BITS - 1
+
+
+def pack_point(x: t.Any, y: t.Any) -> Point:
+    """
+    Packs a coordinate pair into a single int key. Anything that isn't a
+    plain int keeps the "x,y" string the simulator always matched on, so it
+    only meets points written exactly the same way.
+    """
+    if type(x) is int and type(y) is int and -_Y_LIMIT <= y < _Y_LIMIT:
+        return x << _Y_BITS ^ y
+
+    return f"{x},{y}"
+
+
+class Gate:
+    """
+    The parts of a submitted gate the simulation uses. Pins the editor left
+    unconnected, those with a zero or null coordinate, are None.
+    """
+
+    __slots__ = ("type", "id", "inputs", "output")
+
+    def __init__(self, type: str, id: t.Any, inputs: tuple[t.Optional[Point], ...], output: t.Optional[Point]) -> None:
+        self.type = type
+        self.id = id
+        self.inputs = inputs
+        self.output = output
+
+
+def _pack_ends(wires: list[dict], x: str, y: str) -> list[Point]:
+    return [pack_point(wire[x], wire[y]) for wire in wires]
+
+
+def parse_gates(gates: list[dict]) -> list[Gate]:
+    """Reads the submitted gates without touching the payload itself."""
+    try:
+        return [
+            Gate(
+                gate["type"],
+                gate.get("id"),
+                tuple(pack_point(pin["x"], pin["y"]) if pin["x"] and pin["y"] else None for pin in gate["inputs"]),
+                pack_point(gate["output"]["x"], gate["output"]["y"]) if gate["output"]["x"] and gate["output"]["y"] else None,
+            )
+            for gate in gates
+        ]
+
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError("Invalid circuit.")
+
+
+def parse_wires(wires: list[dict]) -> tuple[list[Point], list[Point]]:
+    """Start and end points of the submitted wires, as two parallel lists."""
+    try:
+        return _pack_ends(wires, "startX", "startY"), _pack_ends(wires, "endX", "endY")
+
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError("Invalid circuit.")
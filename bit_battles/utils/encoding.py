@@ -0,0 +1,172 @@
+"""
+Stored circuits are either the original zlib compressed JSON or, from format
+version 1 on, a binary encoding:
+
+    version (1 byte), flags (1 byte), [dictionary id (2 bytes)], deflated body
+
+The body is an array of little endian int32 columns: the gate, wire and point
+counts, then per gate column the type codes, rotations, id codes and delta
+coded x and y, the delta coded x and y of every distinct wire endpoint and
+finally the wires as pairs of indices into those points. zlib streams never
+start with a byte below 0x08, so the first byte tells the formats apart.
+
+With the DICTIONARY flag set the body was deflated with a preset dictionary,
+trained on stored circuits and identified by the id in the header.
+"""
+from itertools import accumulate
+
+import typing as t
+import string
+import orjson
+import array
+import zlib
+import sys
+
+
+FORMAT_VERSION = 1
+DEFLATED = 1
+DICTIONARY = 2
+
+# Deflate can't look back further than its 32KB window, a larger dictionary is never used.
+DICTIONARY_SIZE = 32768
+
+GATE_TYPES = ("AND", "OR", "NOT", "XOR", "INPUT", "OUTPUT")
+GATE_CODES = {type: code for code, type in enumerate(GATE_TYPES)}
+IDS = (None,) + tuple(string.ascii_uppercase)
+ID_CODES = {id: code for code, id in enumerate(IDS)}
+
+GATE_KEYS = ("x", "y", "e", "n", "d")
+WIRE_KEYS = ("Xt", "Yt", "Xd", "Yd")
+
+
+def _deltas(values: list[int]) -> list[int]:
+    return [value - previous for previous, value in zip([0] + values, values)]
+
+
+def _encode_columns(circuit: dict) -> t.Optional[bytes]:
+    gates, wires = circuit["g"], circuit["w"]
+
+    for gate in gates:
+        if tuple(gate) != GATE_KEYS or type(gate["x"]) is not int or type(gate["y"]) is not int:
+            return None
+
+        if gate["e"] not in GATE_CODES or type(gate["n"]) is not int:
+            return None
+
+        if not (gate["d"] is None or type(gate["d"]) is str and gate["d"] in ID_CODES):
+            return None
+
+    points: dict[tuple[int, int], int] = {}
+    ends = []
+
+    for wire in wires:
+        if tuple(wire) != WIRE_KEYS or not all(type(value) is int for value in wire.values()):
+            return None
+
+        for point in ((wire["Xt"], wire["Yt"]), (wire["Xd"], wire["Yd"])):
+            index = points.get(point)
+            if index is None:
+                index = points[point] = len(points)
+
+            ends.append(index)
+
+    try:
+        columns = array.array("i", (len(gates), len(wires), len(points)))
+        columns.extend(GATE_CODES[gate["e"]] for gate in gates)
+        columns.extend(gate["n"] for gate in gates)
+        columns.extend(ID_CODES[gate["d"]] for gate in gates)
+        columns.extend(_deltas([gate["x"] for gate in gates]))
+        columns.extend(_deltas([gate["y"] for gate in gates]))
+        columns.extend(_deltas([x for x, _ in points]))
+        columns.extend(_deltas([y for _, y in points]))
+        columns.extend(ends)
+
+    except OverflowError:
+        return None
+
+    if sys.byteorder == "big":
+        columns.byteswap()
+
+    return columns.tobytes()
+
+
+def _decode_columns(body: bytes) -> dict:
+    columns = array.array("i")
+    columns.frombytes(body)
+
+    if sys.byteorder == "big":
+        columns.byteswap()
+
+    gates, wires, points = columns[0], columns[1], columns[2]
+    offset = 3
+
+    def take(count: int) -> array.array:
+        nonlocal offset
+        offset += count
+        return columns[offset - count:offset]
+
+    types, rotations, ids = take(gates), take(gates), take(gates)
+    xs, ys = accumulate(take(gates)), accumulate(take(gates))
+    coordinates = list(zip(accumulate(take(points)), accumulate(take(points))))
+    ends = iter(take(2 * wires))
+
+    return {
+        "g": [
+            {"x": x, "y": y, "e": GATE_TYPES[type], "n": rotation, "d": IDS[id]}
+            for x, y, type, rotation, id in zip(xs, ys, types, rotations, ids)
+        ],
+        "w": [
+            {"Xt": coordinates[start][0], "Yt": coordinates[start][1], "Xd": coordinates[end][0], "Yd": coordinates[end][1]}
+            for start, end in zip(ends, ends)
+        ],
+    }
+
+
+def encode(circuit: dict, dictionary: t.Optional[tuple[int, bytes]]=None) -> bytes:
+    """
+    Binary encoding of a sanitised circuit, deflated with the given (id,
+    dictionary) if there is one. Circuits it can't represent exactly stay
+    zlib compressed JSON.
+    """
+    body = _encode_columns(circuit)
+    if body is None:
+        return zlib.compress(orjson.dumps(circuit))
+
+    if not dictionary:
+        return bytes((FORMAT_VERSION, DEFLATED)) + zlib.compress(body)
+
+    id, zdict = dictionary
+    compressor = zlib.compressobj(zdict=zdict)
+
+    return bytes((FORMAT_VERSION, DEFLATED | DICTIONARY)) + id.to_bytes(2, "little") + compressor.compress(body) + compressor.flush()
+
+
+def dictionary_id(blob: bytes) -> t.Optional[int]:
+    """Id of the dictionary needed to decode the blob, if it needs one."""
+    if blob[0] != FORMAT_VERSION or not blob[1] & DICTIONARY:
+        return None
+
+    return int.from_bytes(blob[2:4], "little")
+
+
+def decode(blob: bytes, dictionary: t.Optional[bytes]=None) -> dict:
+    if blob[0] != FORMAT_VERSION:
+        return orjson.loads(zlib.decompress(blob))
+
+    if not blob[1] & DICTIONARY:
+        return _decode_columns(zlib.decompress(blob[2:]))
+
+    if dictionary is None:
+        raise ValueError(f"Circuit is compressed with missing dictionary {dictionary_id(blob)}.")
+
+    return _decode_columns(zlib.decompressobj(zdict=dictionary).decompress(blob[4:]))
+
+
+def train_dictionary(circuits: t.Iterable[dict], size: int=DICTIONARY_SIZE) -> bytes:
+    """
+    Builds a preset dictionary from sample circuits. Deflate finds matches
+    in the dictionary like in earlier data, so it is simply the encoded
+    samples back to back, cut to the window size.
+    """
+    bodies = [body for body in map(_encode_columns, circuits) if body]
+    return b"".join(bodies)[-size:]
@@ -0,0 +1,80 @@
+"""
+Socket.IO message queues let every worker emit to clients connected to any
+other worker. SOCKETIO_MESSAGE_QUEUE takes any URL Flask-SocketIO supports
+(redis://, amqp://, kafka://, ...) or a sqlite:/// path, a broker-less queue
+for running several workers on one machine in development and tests.
+"""
+from socketio import PubSubManager
+from contextlib import closing
+
+import typing as t
+import sqlite3
+import time
+
+
+SQLITE_URL = "sqlite:///"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    data TEXT NOT NULL,
+    creation_timestamp REAL NOT NULL
+)
+"""
+
+
+class SQLiteManager(PubSubManager):
+    """
+    Publishes messages by appending them to a table in a shared SQLite
+    file, every worker polls the table for rows it hasn't seen. Rows older
+    than `retention` seconds are deleted when publishing.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, url: str, channel: str="socketio", write_only: bool=False, logger: t.Any=None, interval: float=0.05, retention: float=60) -> None:
+        self.path = url[len(SQLITE_URL):]
+        self.interval = interval
+        self.retention = retention
+
+        with closing(self._connect()) as conn:
+            conn.execute(SCHEMA)
+
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+
+        return conn
+
+    def _publish(self, data: dict) -> None:
+        now = time.time()
+
+        with closing(self._connect()) as conn:
+            conn.execute("INSERT INTO messages (channel, data, creation_timestamp) VALUES (?, ?, ?)", (self.channel, self.json.dumps(data), now))
+            conn.execute("DELETE FROM messages WHERE creation_timestamp < ?", (now - self.retention,))
+
+    def _listen(self) -> t.Iterator[str]:
+        with closing(self._connect()) as conn:
+            # Only messages published after this worker started are for it.
+            last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+
+            while True:
+                rows = conn.execute("SELECT id, data FROM messages WHERE id > ? AND channel = ? ORDER BY id", (last_id, self.channel)).fetchall()
+                for last_id, data in rows:
+                    yield data
+
+                self.server.sleep(self.interval)
+
+
+def message_queue_options(url: t.Optional[str]) -> dict:
+    """Keyword arguments for `SocketIO.init_app` that connect it to the message queue at `url`."""
+    if not url:
+        return {}
+
+    if url.startswith(SQLITE_URL):
+        return {"client_manager": SQLiteManager(url)}
+
+    return {"message_queue": url}
@@ -0,0 +1,274 @@
+from bit_battles.utils.connectivity import ConnectivityIndex
+from bit_battles.utils.elements import Point, parse_gates, parse_wires
+
+from collections import defaultdict
+from functools import reduce
+
+import typing as t
+import operator
+
+
+EVALUATORS: dict[str, t.Callable[[list], int]] = {
+    "AND": lambda inputs: int(all(inputs)),
+    "OR": lambda inputs: int(any(inputs)),
+    "NOT": lambda inputs: int(not inputs[0]),
+    "XOR": lambda inputs: int(inputs.count(1) == 1),
+    "OUTPUT": lambda inputs: inputs[0],
+}
+
+
+def _one_hot(inputs: list[int], mask: int) -> int:
+    ones, twos = 0, 0
+    for value in inputs:
+        twos |= ones & value
+        ones |= value
+
+    return ones & ~twos & mask
+
+
+MASK_EVALUATORS: dict[str, t.Callable[[list[int], int], int]] = {
+    "AND": lambda inputs, mask: reduce(operator.and_, inputs),
+    "OR": lambda inputs, mask: reduce(operator.or_, inputs),
+    "NOT": lambda inputs, mask: ~inputs[0] & mask,
+    "XOR": _one_hot,
+    "OUTPUT": lambda inputs, mask: inputs[0],
+}
+
+
+class Netlist:
+    """
+    Indexed form of an editor circuit. Gates are referred to by their index in
+    the submitted list and `order` holds every gate that gets evaluated, in
+    topological order, together with the nodes driving each of its inputs.
+    Evaluating a truth table row is a single pass over `order`.
+
+    Signals are spread over the wires with an explicit stack rather than
+    recursion, so long wire chains don't run into the recursion limit.
+
+    The payload is parsed into Gate and Wire objects first and never modified.
+    """
+
+    def __init__(self, gates: list[dict], wires: list[dict], gate_limits: dict) -> None:
+        self._gates = parse_gates(gates)
+        self._starts, self._ends = parse_wires(wires)
+        self._connectivity = ConnectivityIndex(self._starts, self._ends)
+
+        self._input_lookup: dict[Point, int] = {}
+        self._fanin: list[list[int]] = []
+        self._slots: dict[tuple[int, int], int] = {}
+        self._output_wires: dict[int, t.Optional[int]] = {}
+        self._drivers: list[t.Optional[int]] = []
+        self._shared_pins = False
+
+        self.ids: list[t.Any] = [gate.id for gate in self._gates]
+        self.inputs: list[int] = []
+        self.outputs: list[int] = []
+        self.order: list[tuple[int, str, tuple[int, ...]]] = []
+        self.paths: list[int] = [0] * len(gates)
+
+        self._index(gate_limits)
+        self._trace()
+
+    @property
+    def size(self) -> int:
+        return len(self._gates)
+
+    @property
+    def longest_path(self) -> int:
+        return max([0] + [self.paths[output] - 1 for output in self.outputs])
+
+    @property
+    def order_sensitive(self) -> bool:
+        """
+        Whether the result could change if the same gates and wires were
+        submitted in a different order: nets driven by more than one gate,
+        output pins fanning out straight into gate inputs or pins sharing a
+        point.
+        """
+        if self._shared_pins:
+            return True
+
+        for node in self.inputs + [node for node, _, _ in self.order]:
+            wire = self._output_wires.get(node)
+            if wire is None:
+                continue
+
+            if self._drivers[wire] != node:
+                return True
+
+            wires = self._connectivity.wires_at(self._gates[node].output)
+            if len(wires) > 1 and any(self._is_pin_wire(_wire) for _wire in wires):
+                return True
+
+        return False
+
+    def _is_pin_wire(self, wire: int) -> bool:
+        return self._starts[wire] in self._input_lookup or self._ends[wire] in self._input_lookup
+
+    def _index(self, gate_limits: dict) -> None:
+        gate_counts = defaultdict(int)
+        for index, gate in enumerate(self._gates):
+            gate_counts[gate.type] += 1
+            limit = gate_limits.get(gate.type)
+
+            if limit:
+                if gate_counts[gate.type] > limit:
+                    raise ValueError(f"Maximum amount of {gate.type} gates exceeded.")
+
+            fanin = []
+            for point in gate.inputs:
+                if point is None:
+                    continue
+
+                wires = self._connectivity.wires_at(point)
+
+                if not wires:
+                    continue
+
+                if len(wires) > 1:
+                    raise ValueError("Invalid circuit. Gate inputs cannot have more than one input wire.")
+
+                if point in self._input_lookup:
+                    self._shared_pins = True
+
+                self._slots[(index, wires[0])] = len(fanin)
+                self._input_lookup[point] = index
+                fanin.append(wires[0])
+
+            self._fanin.append(fanin)
+
+        for start, end in zip(self._starts, self._ends):
+            if start in self._input_lookup and end in self._input_lookup:
+                self._shared_pins = True
+
+    def _get_output_wire(self, gate: int) -> t.Optional[int]:
+        if gate in self._output_wires:
+            return self._output_wires[gate]
+
+        point = self._gates[gate].output
+        wire = None
+
+        if point is not None:
+            wires = self._connectivity.wires_at(point)
+
+            if wires:
+                wire = wires[0]
+
+        self._output_wires[gate] = wire
+        return wire
+
+    def _walk(self, sources: t.Iterable[tuple[int, t.Any]], complete: t.Callable[[int, list], t.Any]) -> tuple[list, list[int]]:
+        signals: list = [None] * len(self._starts)
+        paths = [0] * len(self._gates)
+        arrived: list[list] = [[None] * len(fanin) for fanin in self._fanin]
+        pending = [len(fanin) for fanin in self._fanin]
+
+        for source, signal in sources:
+            stack = [(source, signal, 0)]
+
+            while stack:
+                wire, signal, path = stack.pop()
+                if signals[wire] is not None:
+                    continue
+
+                signals[wire] = signal
+                start, end = self._starts[wire], self._ends[wire]
+
+                gate = self._input_lookup.get(start)
+                if gate is None:
+                    gate = self._input_lookup.get(end)
+
+                if gate is None:
+                    # Pushed in reverse so they are visited in the same order as a recursive walk would.
+                    wires = self._connectivity.wires_at(start) + self._connectivity.wires_at(end)
+                    stack.extend((_wire, signal, path) for _wire in reversed(wires) if signals[_wire] is None)
+                    continue
+
+                paths[gate] = max(paths[gate], path)
+
+                slot = self._slots.get((gate, wire))
+                if slot is None:
+                    raise ValueError("Invalid gate 1")
+
+                arrived[gate][slot] = signal
+                pending[gate] -= 1
+
+                if pending[gate] > 0:
+                    continue
+
+                output = complete(gate, arrived[gate])
+                output_wire = self._get_output_wire(gate)
+                paths[gate] += 1
+
+                if output_wire is not None:
+                    stack.append((output_wire, output, paths[gate]))
+
+        return signals, paths
+
+    def _record(self, gate: int, drivers: list) -> int:
+        gate_type = self._gates[gate].type
+        if gate_type == "INPUT":
+            raise ValueError("Inputs should not evaluated")
+
+        if gate_type not in EVALUATORS:
+            raise ValueError("Invalid circuit. Gate does not exist")
+
+        self.order.append((gate, gate_type, tuple(drivers)))
+        return gate
+
+    def _sources(self) -> t.Iterator[tuple[int, int]]:
+        for index, gate in enumerate(self._gates):
+            if gate.type == "OUTPUT":
+                self.outputs.append(index)
+                continue
+
+            if gate.type != "INPUT":
+                continue
+
+            wire = self._get_output_wire(index)
+            if wire is None:
+                continue
+
+            self.inputs.append(index)
+            yield wire, index
+
+    def _trace(self) -> None:
+        self._drivers, self.paths = self._walk(self._sources(), self._record)
+
+    def propagate(self, states: dict) -> list:
+        values = [0] * self.size
+
+        def complete(gate: int, inputs: list) -> t.Any:
+            values[gate] = EVALUATORS[self._gates[gate].type](inputs)
+            return values[gate]
+
+        sources = []
+        for node in self.inputs:
+            values[node] = states.get(self.ids[node], 1)
+            sources.append((self._output_wires[node], values[node]))
+
+        self._walk(sources, complete)
+        return values
+
+    def evaluate(self, states: dict) -> list:
+        values = [0] * self.size
+
+        for node in self.inputs:
+            values[node] = states.get(self.ids[node], 1)
+
+        for node, gate_type, fanin in self.order:
+            values[node] = EVALUATORS[gate_type]([values[i] for i in fanin])
+
+        return values
+
+    def evaluate_masks(self, columns: dict, rows: int) -> list[int]:
+        mask = (1 << rows) - 1
+        values = [0] * self.size
+
+        for node in self.inputs:
+            values[node] = columns.get(self.ids[node], mask)
+
+        for node, gate_type, fanin in self.order:
+            values[node] = MASK_EVALUATORS[gate_type]([values[i] for i in fanin], mask)
+
+        return values
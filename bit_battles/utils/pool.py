@@ -0,0 +1,130 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import multiprocessing
+import typing as t
+import threading
+import atexit
+import signal
+
+
+class PoolSaturated(Exception):
+    def __init__(self, retry_after: int) -> None:
+        super().__init__("The server is busy, please submit again in a moment.")
+        self.retry_after = retry_after
+
+
+class SimulationTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame) -> None:
+    raise SimulationTimeout("Invalid circuit. Simulation took too long.")
+
+
+def _run_with_budget(budget: float, function: t.Callable, *args) -> t.Any:
+    # Signal handlers can only be set from the main thread, e.g. the threaded dev server runs without a budget.
+    if threading.current_thread() is not threading.main_thread():
+        return function(*args)
+
+    # Counts CPU time of the process only, time spent waiting in the queue doesn't count.
+    signal.signal(signal.SIGVTALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_VIRTUAL, budget)
+
+    try:
+        return function(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+
+
+class SimulationPool:
+    """
+    Runs simulations in worker processes so a heavy circuit can't stall the
+    eventlet worker. At most `queue_size` jobs are in flight, further jobs are
+    refused with PoolSaturated instead of piling up, and every job gets
+    `budget` seconds of CPU time. With no workers jobs run inline.
+    """
+
+    def __init__(self, workers: int, queue_size: int, budget: float, wait: float, retry_after: int) -> None:
+        self._workers = workers
+        self._budget = budget
+        self._wait = wait
+        self._retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._executor: t.Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+
+        atexit.register(self.shutdown)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if not self._executor:
+                self._executor = ProcessPoolExecutor(self._workers, mp_context=multiprocessing.get_context("spawn"))
+
+            return self._executor
+
+    def _reset(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self, future) -> None:
+        self._slots.release()
+
+    def run(self, function: t.Callable, *args) -> t.Any:
+        if not self._workers:
+            return _run_with_budget(self._budget, function, *args)
+
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PoolSaturated(self._retry_after)
+
+        executor = self._get_executor()
+
+        try:
+            future = executor.submit(_run_with_budget, self._budget, function, *args)
+        except (BrokenProcessPool, RuntimeError):
+            self._slots.release()
+            self._reset(executor)
+            raise PoolSaturated(self._retry_after)
+
+        future.add_done_callback(self._release)
+
+        try:
+            result = future.result(timeout=self._wait)
+        except TimeoutError:
+            future.cancel()
+            self.timeouts += 1
+            raise PoolSaturated(self._retry_after)
+
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise PoolSaturated(self._retry_after)
+
+        self.completed += 1
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        # Under eventlet the executor's management thread is a green thread, a process that doesn't
+        # wait for it never exits. Running simulations are waited for, the CPU budget bounds them.
+        # Killing their workers would break the pool, and the executor's cleanup of a broken pool
+        # never finishes under eventlet either.
+        if executor:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self._workers,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
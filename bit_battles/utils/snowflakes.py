@@ -1,36 +1,66 @@
+from bit_battles.config import SNOWFLAKE_MACHINE_ID
+
+import threading
 import time
 
+
+# Milliseconds since the epoch, then 10 bits of machine id and 12 of sequence.
+MACHINE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_MACHINE_ID = (1 << MACHINE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# A clock that went back further than this isn't waited for, ids keep counting from the last timestamp instead.
+MAX_ROLLBACK_WAIT = 10
+
+if not 0 <= SNOWFLAKE_MACHINE_ID <= MAX_MACHINE_ID:
+    raise ValueError(f"SNOWFLAKE_MACHINE_ID has to be between 0 and {MAX_MACHINE_ID}.")
+
+
 class SnowflakeGenerator:
-    machine_id = 1
+    """
+    Ids are unique as long as every process that generates them has its own
+    machine id, within a process the generator is shared behind a lock.
+    """
+
+    machine_id = SNOWFLAKE_MACHINE_ID
     sequence = 0
     last_timestamp = -1
+    _lock = threading.Lock()
 
     @staticmethod
-    def wait_for_next_ms(last_timestamp):
-        current_timestamp = int(time.time() * 1000)
+    def timestamp() -> int:
+        return int(time.time() * 1000)
 
-        while current_timestamp <= last_timestamp:
-            current_timestamp = int(time.time() * 1000)
+    @staticmethod
+    def wait_for_next_ms(last_timestamp: int) -> int:
+        current_timestamp = SnowflakeGenerator.timestamp()
 
-        return current_timestamp
+        # Sleeping lets other threads and greenlets run, spinning would hold the worker.
+        if last_timestamp - current_timestamp < MAX_ROLLBACK_WAIT:
+            while current_timestamp <= last_timestamp:
+                time.sleep((last_timestamp - current_timestamp + 1) / 1000)
+                current_timestamp = SnowflakeGenerator.timestamp()
 
-    @staticmethod
-    def generate_id():
-        current_timestamp = int(time.time() * 1000)
+        return max(current_timestamp, last_timestamp + 1)
 
-        if current_timestamp == SnowflakeGenerator.last_timestamp:
-            SnowflakeGenerator.sequence = (SnowflakeGenerator.sequence + 1) & 4095
-            if SnowflakeGenerator.sequence == 0:
-                current_timestamp = SnowflakeGenerator.wait_for_next_ms(current_timestamp)
-        else:
-            SnowflakeGenerator.sequence = 0
+    @classmethod
+    def generate_id(cls) -> int:
+        with cls._lock:
+            # Never go back in time, ids would repeat ones generated before the clock was set back.
+            current_timestamp = max(cls.timestamp(), cls.last_timestamp)
 
-        SnowflakeGenerator.last_timestamp = current_timestamp
+            if current_timestamp == cls.last_timestamp:
+                cls.sequence = (cls.sequence + 1) & MAX_SEQUENCE
+                if cls.sequence == 0:
+                    current_timestamp = cls.wait_for_next_ms(current_timestamp)
+            else:
+                cls.sequence = 0
 
-        snowflake_id = (
-            (current_timestamp << 22)
-            | (SnowflakeGenerator.machine_id << 12)
-            | SnowflakeGenerator.sequence
-        )
+            cls.last_timestamp = current_timestamp
 
-        return snowflake_id
+            return (
+                (current_timestamp << (MACHINE_BITS + SEQUENCE_BITS))
+                | (cls.machine_id << SEQUENCE_BITS)
+                | cls.sequence
+            )
@@ -0,0 +1,146 @@
+from bit_battles.config import CIRCUITS_DATABASE, CIRCUITS_POOL_SIZE
+
+from contextlib import contextmanager
+
+import typing as t
+import threading
+import sqlite3
+import queue
+import os
+
+
+TABLES = ("battle", "daily", "challenge")
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS battle_circuits(
+        id TEXT PRIMARY KEY,
+        battle_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        circuit TEXT NOT NULL,
+        creation_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS daily_circuits(
+        id TEXT PRIMARY KEY,
+        daily_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        circuit TEXT NOT NULL,
+        creation_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS challenge_circuits(
+        id TEXT PRIMARY KEY,
+        challenge_id TEXT NOT NULL,
+        user_id TEXT NOT NULL,
+        circuit TEXT NOT NULL,
+        creation_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS circuit_blobs(
+        hash TEXT PRIMARY KEY,
+        circuit BLOB NOT NULL,
+        creation_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS circuit_dictionaries(
+        id INTEGER PRIMARY KEY,
+        dictionary BLOB NOT NULL,
+        creation_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+"""
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+)
+
+
+class ConnectionPool:
+    """
+    Keeps up to `size` open connections to one SQLite database and hands
+    them out one holder at a time, blocking when all of them are in use.
+    Connections are reused across requests, so the sqlite3 statement cache
+    keeps the queries prepared.
+    """
+
+    def __init__(self, path: str, size: int) -> None:
+        self._path = path
+        self._size = size
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._path, check_same_thread=False, cached_statements=64)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self._size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except sqlite3.Error:
+                    self._opened -= 1
+                    raise
+
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self) -> t.Iterator[sqlite3.Connection]:
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+
+            self._idle.put(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+                self._opened -= 1
+
+
+connection_pool = ConnectionPool(CIRCUITS_DATABASE, CIRCUITS_POOL_SIZE)
+
+
+def get_db_connection() -> t.ContextManager[sqlite3.Connection]:
+    return connection_pool.connection()
+
+
+def init_circuits_db() -> None:
+    """Creates the circuits database, runs once when the app starts."""
+    directory = os.path.dirname(CIRCUITS_DATABASE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with get_db_connection() as conn:
+        conn.executescript(SCHEMA)
+
+        # Rows saved before circuits were deduplicated keep their blob in `circuit` and have no hash.
+        for table in TABLES:
+            columns = {column[1] for column in conn.execute(f"PRAGMA table_info({table}_circuits)")}
+            if "circuit_hash" not in columns:
+                conn.execute(f"ALTER TABLE {table}_circuits ADD COLUMN circuit_hash TEXT")
+
+            conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_circuits_hash ON {table}_circuits(circuit_hash)")
+
+        conn.commit()
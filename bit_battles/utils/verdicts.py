@@ -0,0 +1,156 @@
+from bit_battles.utils.battle import Simulate
+from bit_battles.utils.pool import SimulationPool
+from bit_battles.config import VERDICT_CACHE_SIZE, VERDICT_CACHE_TIMEOUT, SIMULATION_WORKERS, SIMULATION_QUEUE_SIZE, SIMULATION_CPU_BUDGET, SIMULATION_WAIT, SIMULATION_RETRY_AFTER
+
+from collections import OrderedDict
+
+import typing as t
+import threading
+import hashlib
+import orjson
+import time
+
+
+# (passed, longest path, feedback), feedback is only there for failed circuits.
+Verdict = tuple[bool, int, t.Optional[dict]]
+
+
+class VerdictCache:
+    def __init__(self, size: int, timeout: int) -> None:
+        self._size = size
+        self._timeout = timeout
+        self._verdicts: OrderedDict[tuple, tuple[float, Verdict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> t.Optional[Verdict]:
+        with self._lock:
+            entry = self._verdicts.get(key)
+
+            if not entry or entry[0] < time.monotonic():
+                if entry:
+                    del self._verdicts[key]
+
+                self.misses += 1
+                return None
+
+            self._verdicts.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: tuple, verdict: Verdict) -> None:
+        with self._lock:
+            self._verdicts[key] = (time.monotonic() + self._timeout, verdict)
+            self._verdicts.move_to_end(key)
+
+            while len(self._verdicts) > self._size:
+                self._verdicts.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._verdicts.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._verdicts),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+verdict_cache = VerdictCache(VERDICT_CACHE_SIZE, VERDICT_CACHE_TIMEOUT)
+simulation_pool = SimulationPool(SIMULATION_WORKERS, SIMULATION_QUEUE_SIZE, SIMULATION_CPU_BUDGET, SIMULATION_WAIT, SIMULATION_RETRY_AFTER)
+
+
+def _get_offsets(gates: list[dict], wires: list[dict]) -> tuple[int, int]:
+    xs, ys = [], []
+
+    for gate in gates:
+        for pin in gate["inputs"] + [gate["output"]]:
+            xs.append(pin["x"])
+            ys.append(pin["y"])
+
+    for wire in wires:
+        xs.extend((wire["startX"], wire["endX"]))
+        ys.extend((wire["startY"], wire["endY"]))
+
+    xs = [x for x in xs if x is not None]
+    ys = [y for y in ys if y is not None]
+
+    # Pins at 0 count as unconnected and floats don't survive shifting, those circuits are hashed as is.
+    if not xs or not ys or not all(type(value) is int and value for value in xs + ys):
+        return 0, 0
+
+    return 1 - min(xs), 1 - min(ys)
+
+
+def get_circuit_hash(gates: list[dict], wires: list[dict]) -> t.Optional[str]:
+    """
+    Hash of the parts of a circuit the simulation looks at. Gate positions,
+    rotation, editor state and the order of gates and wires are left out and
+    coordinates are shifted to start at 1, so the same solution hashes the
+    same no matter who drew it or where. Returns None for malformed circuits.
+    """
+    try:
+        dx, dy = _get_offsets(gates, wires)
+
+        def shift(pin: dict) -> list:
+            return [pin["x"] + dx if pin["x"] is not None else None, pin["y"] + dy if pin["y"] is not None else None]
+
+        canonical_gates = sorted(
+            orjson.dumps([gate["type"], gate["id"], [shift(pin) for pin in gate["inputs"]], shift(gate["output"])])
+            for gate in gates
+        )
+        canonical_wires = sorted(
+            orjson.dumps(sorted([
+                shift({"x": wire["startX"], "y": wire["startY"]}),
+                shift({"x": wire["endX"], "y": wire["endY"]}),
+            ], key=orjson.dumps))
+            for wire in wires
+        )
+
+    except (KeyError, TypeError, AttributeError, orjson.JSONEncodeError):
+        return None
+
+    digest = hashlib.blake2b(digest_size=16)
+    for element in canonical_gates + [b"|"] + canonical_wires:
+        digest.update(element)
+
+    return digest.hexdigest()
+
+
+def get_truthtable_hash(truthtable: dict) -> str:
+    return hashlib.blake2b(orjson.dumps(truthtable, option=orjson.OPT_SORT_KEYS), digest_size=16).hexdigest()
+
+
+def _simulate(gates: list[dict], wires: list[dict], gate_limits: dict, truthtable: dict) -> tuple[Verdict, bool]:
+    simulation = Simulate(gates, wires, gate_limits)
+    passed, longest_path = simulation.test(truthtable)
+    verdict = (passed, longest_path, None if passed else simulation.diagnose(truthtable))
+
+    # Only verdicts that don't depend on submission order, and outputs that all have a column, are shared.
+    netlist = simulation.netlist
+    outputs = {column for column in truthtable if ord(column) > 77}
+
+    return verdict, not netlist.order_sensitive and all(netlist.ids[output] in outputs for output in netlist.outputs)
+
+
+def verify(gates: list[dict], wires: list[dict], gate_limits: dict, truthtable: dict) -> Verdict:
+    circuit_hash = get_circuit_hash(gates, wires)
+    if not circuit_hash:
+        verdict, _ = simulation_pool.run(_simulate, gates, wires, gate_limits, truthtable)
+        return verdict
+
+    key = (circuit_hash, get_truthtable_hash(truthtable), tuple(sorted(gate_limits.items())))
+    verdict = verdict_cache.get(key)
+    if verdict:
+        return verdict
+
+    verdict, shareable = simulation_pool.run(_simulate, gates, wires, gate_limits, truthtable)
+    if shareable:
+        verdict_cache.set(key, verdict)
+
+    return verdict
@@ -0,0 +1,31 @@
+"""daily streaks
+
+Revision ID: 3f9a2c71d4e8
+Revises: 61d68ca15400
+Create Date: 2026-10-18 14:02:31.514802
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a2c71d4e8'
+down_revision = '61d68ca15400'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_streaks',
+    sa.Column('user_id', sa.String(length=128), nullable=False),
+    sa.Column('current', sa.Integer(), nullable=True),
+    sa.Column('longest', sa.Integer(), nullable=True),
+    sa.Column('last_passed', sa.Date(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('daily_streaks')
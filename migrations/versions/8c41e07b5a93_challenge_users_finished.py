@@ -0,0 +1,33 @@
+"""challenge users finished
+
+Revision ID: 8c41e07b5a93
+Revises: 3f9a2c71d4e8
+Create Date: 2026-10-18 15:10:47.208311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c41e07b5a93'
+down_revision = '3f9a2c71d4e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('challenges', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('users_finished', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute(
+        "UPDATE challenges SET users_finished = ("
+        "SELECT COUNT(*) FROM challenge_statistics "
+        "WHERE challenge_statistics.challenge_id = challenges.id AND challenge_statistics.passed"
+        ")"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('challenges', schema=None) as batch_op:
+        batch_op.drop_column('users_finished')
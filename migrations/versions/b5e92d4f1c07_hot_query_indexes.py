@@ -0,0 +1,43 @@
+"""hot query indexes
+
+Revision ID: b5e92d4f1c07
+Revises: 8c41e07b5a93
+Create Date: 2026-10-18 16:21:09.631457
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e92d4f1c07'
+down_revision = '8c41e07b5a93'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_users_token', 'users', ['token']),
+    ('ix_users_battle_token', 'users', ['battle_token']),
+    ('ix_players_user_id', 'players', ['user_id']),
+    ('ix_battles_stage_private', 'battles', ['stage', 'private']),
+    ('ix_battle_statistics_user_id_creation_timestamp', 'battle_statistics', ['user_id', 'creation_timestamp']),
+    ('ix_daily_challenge_statistics_date_passed', 'daily_challenge_statistics', ['date', 'passed']),
+    ('ix_daily_challenge_statistics_user_id_date_passed', 'daily_challenge_statistics', ['user_id', 'date', 'passed']),
+    ('ix_challenge_statistics_challenge_id_user_id_passed', 'challenge_statistics', ['challenge_id', 'user_id', 'passed']),
+    ('ix_challenge_statistics_user_id_passed', 'challenge_statistics', ['user_id', 'passed']),
+    ('ix_challenges_official_rating', 'challenges', ['official', 'rating', 'creation_timestamp']),
+    ('ix_challenges_official_creation_timestamp', 'challenges', ['official', 'creation_timestamp']),
+    ('ix_challenges_official_users_finished', 'challenges', ['official', 'users_finished', 'creation_timestamp']),
+    ('ix_challenges_user_id', 'challenges', ['user_id']),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,29 @@
+"""daily streaks bridged
+
+Revision ID: d2b7e4a9c613
+Revises: b5e92d4f1c07
+Create Date: 2026-10-18 19:12:47.208316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7e4a9c613'
+down_revision = 'b5e92d4f1c07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('daily_streaks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('bridged', sa.Integer(), nullable=True))
+
+    # A lower bound until `flask challenges backfill-streaks` counts the skipped days.
+    op.execute('UPDATE daily_streaks SET bridged = current')
+
+
+def downgrade():
+    with op.batch_alter_table('daily_streaks', schema=None) as batch_op:
+        batch_op.drop_column('bridged')